@@ -0,0 +1,77 @@
+"""Script to compare the size and read latency of the JSON storage formats."""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+import zstandard
+from benchmark_parsing import synthetic_records
+
+
+def formats(samples: list[bytes]) -> dict:
+    """Get the encoder and decoder of each storage format."""
+    from takeout_maps.takeout import compression
+
+    dictionary = zstandard.train_dictionary(
+        compression.DICTIONARY_SIZE, list(samples[: compression.TRAINING_SAMPLES])
+    )
+    plain = zstandard.ZstdCompressor(level=compression.LEVEL)
+    trained = zstandard.ZstdCompressor(level=compression.LEVEL, dict_data=dictionary)
+    return {
+        "text": (bytes.decode, lambda value: value),
+        "zstd": (plain.compress, zstandard.ZstdDecompressor().decompress),
+        "zstd+dict": (
+            trained.compress,
+            zstandard.ZstdDecompressor(dict_data=dictionary).decompress,
+        ),
+    }
+
+
+def main():
+    """Measure the size and read latency of each storage format."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--records", type=int, default=200_000)
+    parser.add_argument("--reads", type=int, default=10_000)
+    args = parser.parse_args()
+    samples = [
+        json.dumps(record, separators=(",", ":")).encode()
+        for record in synthetic_records(args.records)["locations"]
+    ]
+    ids = random.sample(range(len(samples)), min(args.reads, len(samples)))
+    with tempfile.TemporaryDirectory() as directory:
+        # The takeout package reads the takeout from the environment and arguments.
+        os.environ.setdefault("GOOGLE_TAKEOUT_DIRECTORY", directory)
+        del sys.argv[1:]
+        for name, (encode, decode) in formats(samples).items():
+            path = os.path.join(directory, f"{name}.sqlite")
+            with sqlite3.connect(path) as connection:
+                connection.execute(
+                    "CREATE TABLE records (id INTEGER PRIMARY KEY, json)"
+                )
+                connection.executemany(
+                    "INSERT INTO records VALUES (?, ?)",
+                    ((id, encode(sample)) for id, sample in enumerate(samples)),
+                )
+            size = os.path.getsize(path)
+            with sqlite3.connect(path) as connection:
+                start = time.perf_counter()
+                for id in ids:
+                    decode(
+                        connection.execute(
+                            "SELECT json FROM records WHERE id = ?", (id,)
+                        ).fetchone()[0]
+                    )
+                elapsed = time.perf_counter() - start
+            print(
+                f"{name:>10}: {size / (1 << 20):8.1f} MiB,"
+                f" {size / len(samples):6.1f} B/record,"
+                f" {elapsed / len(ids) * 1e6:6.1f} µs/read"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Script to compare parsing Fitbit intraday datasets row by row and as arrays."""
+import argparse
+import datetime
+import random
+import re
+import time
+from typing import Any
+
+from takeout_maps.api import fitbit_arrays, serving, streaming
+from takeout_maps.api.serving import fitbit as fitbit_models
+
+HMS = re.compile(r"(\d{2}):(\d{2}):(\d{2})")
+
+
+def synthetic_response(date: datetime.date) -> dict[str, Any]:
+    """Generate a day of intraday steps shaped like a Fitbit response."""
+    return {
+        "activities-steps": [{"dateTime": date.isoformat(), "value": "0"}],
+        "activities-steps-intraday": {
+            "dataset": [
+                {
+                    "time": f"{minute // 60:02}:{minute % 60:02}:00",
+                    "value": random.randint(0, 200),
+                }
+                for minute in range(1440)
+            ],
+            "datasetInterval": 1,
+            "datasetType": "minute",
+        },
+    }
+
+
+def rows(response: dict[str, Any]) -> bytes:
+    """Parse a response row by row, into the serving models."""
+    year, month, day = re.split(
+        r"(\d{4})-(\d{2})-(\d{2})", response["activities-steps"][0]["dateTime"]
+    )[1:-1]
+    end = datetime.timedelta(
+        **{
+            response["activities-steps-intraday"]["datasetType"]
+            + "s": response["activities-steps-intraday"]["datasetInterval"]
+        }
+    )
+
+    def process_row(val: dict[str, Any]) -> fitbit_models.Steps:
+        hours, mins, secs = map(int, HMS.split(val["time"])[1:-1])
+        start = datetime.datetime(int(year), int(month), int(day), hours, mins, secs)
+        return fitbit_models.Steps(start=start, end=start + end, value=val["value"])
+
+    return (
+        serving.Dataset[fitbit_models.Steps, dict[str, Any]](
+            data=[
+                process_row(steps)
+                for steps in response["activities-steps-intraday"]["dataset"]
+            ]
+        )
+        .model_dump_json()
+        .encode()
+    )
+
+
+def arrays(response: dict[str, Any]) -> bytes:
+    """Parse a response as arrays, serializing them directly."""
+    return streaming.dump_model(
+        serving.Dataset[fitbit_models.Steps, dict[str, Any]],
+        "data",
+        fitbit_arrays.IntradayArrays.parse(response, "steps").to_json(),
+    )
+
+
+def timeit(fn) -> float:
+    """Time a function once."""
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def main():
+    """Time parsing synthetic intraday datasets as rows and as arrays."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    responses = [
+        synthetic_response(datetime.date(2020, 1, 1) + datetime.timedelta(days=day))
+        for day in range(args.days)
+    ]
+    assert all(rows(response) == arrays(response) for response in responses)
+    for name, parse in (("rows", rows), ("arrays", arrays)):
+        elapsed = min(
+            timeit(lambda: [parse(response) for response in responses])
+            for _ in range(args.repeat)
+        )
+        print(
+            f"{name:>8}: {elapsed / args.days * 1e3:8.2f} ms/day,"
+            f" {args.days * 1440 / elapsed:12,.0f} rows/s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Script to compare the JSON parsers on a synthetic Records.json."""
+import argparse
+import datetime
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+import ijson
+
+
+def synthetic_records(count: int) -> dict:
+    """Generate records shaped like those in Records.json."""
+    start = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+    return {
+        "locations": [
+            {
+                "latitudeE7": 515_000_000 + random.randint(-100_000, 100_000),
+                "longitudeE7": -1_000_000 + random.randint(-100_000, 100_000),
+                "accuracy": random.randint(3, 100),
+                "altitude": random.randint(0, 120),
+                "velocity": random.randint(0, 30),
+                "heading": random.randint(0, 359),
+                "activity": [
+                    {
+                        "activity": [
+                            {"type": "STILL", "confidence": random.randint(0, 100)},
+                            {"type": "WALKING", "confidence": random.randint(0, 100)},
+                        ],
+                        "timestamp": (
+                            start + datetime.timedelta(seconds=i)
+                        ).isoformat(),
+                    }
+                ],
+                "source": "WIFI",
+                "deviceTag": 123456789,
+                "timestamp": (start + datetime.timedelta(minutes=i)).isoformat(),
+            }
+            for i in range(count)
+        ]
+    }
+
+
+def benchmark(name: str, parse, path: str):
+    """Time parsing all the records and getting the compact JSON of each."""
+    start = time.perf_counter()
+    count = sum(1 for _ in parse(path))
+    elapsed = time.perf_counter() - start
+    print(f"{name:>12}: {count / elapsed:>12,.0f} records/s ({elapsed:.2f}s)")
+
+
+def main():
+    """Time each JSON parser on synthetic records."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--records", type=int, default=200_000)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "Takeout", "Location History", "Records.json")
+        os.makedirs(os.path.dirname(path))
+        with open(path, "w") as fp:
+            json.dump(synthetic_records(args.records), fp, indent=2)
+        print(f"{os.path.getsize(path) / (1 << 20):.1f} MiB, {args.records:,} records")
+
+        # The takeout package reads the takeout from the environment and arguments.
+        os.environ["GOOGLE_TAKEOUT_DIRECTORY"] = directory
+        del sys.argv[1:]
+        import takeout_maps.constants
+        from takeout_maps.takeout import parsing
+
+        def stdlib(path: str):
+            with open(path, "rb") as fp:
+                for item in json.load(fp)["locations"]:
+                    yield parsing.dumps(item)
+
+        def streamed(path: str):
+            with open(path, "rb") as fp:
+                for batch, _ in parsing.iter_batches(fp, "locations", 50_000):
+                    for item in batch:
+                        yield parsing.dumps(item)
+
+        benchmark("json", stdlib, path)
+        for name in parsing.BACKENDS:
+            try:
+                ijson.get_backend(name)
+            except ImportError:
+                print(f"{name:>12}: not available")
+                continue
+            takeout_maps.constants.JSON_BACKEND = name
+            parsing.backend.cache_clear()
+            benchmark(name, streamed, path)
+        if parsing.simdjson is None:
+            print(f"{'simdjson':>12}: not available")
+        else:
+            benchmark("simdjson", lambda path: parsing.items(path, "locations"), path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Script to measure the bytes per point of the wire formats of the locations."""
+import argparse
+import datetime
+
+import numpy as np
+
+from takeout_maps.api import serving, wire
+
+
+def synthetic_day(count: int) -> dict[str, np.ndarray]:
+    """Generate a day of locations as a random walk, with a few gaps."""
+    rng = np.random.default_rng(0)
+    start = np.datetime64("2020-01-01T00:00:00", "ms").astype(np.int64)
+    accuracy = rng.integers(3, 100, count).astype(np.int16)
+    altitude = rng.integers(0, 120, count).astype(np.float32)
+    return dict(
+        timestamp=(start + np.cumsum(rng.integers(1_000, 120_000, count))).astype(
+            "datetime64[ms]"
+        ),
+        latitude_e7=(
+            515_000_000 + np.cumsum(rng.integers(-2_000, 2_000, count))
+        ).astype(np.int32),
+        longitude_e7=(
+            -1_000_000 + np.cumsum(rng.integers(-3_000, 3_000, count))
+        ).astype(np.int32),
+        accuracy=np.ma.masked_array(accuracy, mask=rng.random(count) < 0.05),
+        altitude=np.ma.masked_array(altitude, mask=rng.random(count) < 0.3),
+    )
+
+
+def encodings(columns: dict[str, np.ndarray]) -> dict[str, bytes]:
+    """Encode the locations in each of the available formats."""
+    metadata = dict(start=datetime.date(2020, 1, 1), end=datetime.date(2020, 1, 1))
+    bodies = {
+        wire.JSON: serving.LocationData(
+            locations=[
+                serving.Location(
+                    latitude=latitude / 1e7,
+                    longitude=longitude / 1e7,
+                    timestamp=timestamp,
+                    accuracy=accuracy,
+                    altitude=altitude,
+                )
+                for timestamp, latitude, longitude, accuracy, altitude in zip(
+                    columns["timestamp"].tolist(),
+                    columns["latitude_e7"].tolist(),
+                    columns["longitude_e7"].tolist(),
+                    columns["accuracy"].tolist(),
+                    columns["altitude"].tolist(),
+                )
+            ],
+            **metadata,
+        )
+        .model_dump_json()
+        .encode(),
+        wire.POLYLINE: wire.polyline(
+            columns["latitude_e7"],
+            columns["longitude_e7"],
+            columns["timestamp"].astype(np.int64),
+            **metadata,
+        ),
+    }
+    for media_type in wire.available(wire.MSGPACK, wire.ARROW):
+        bodies[media_type] = wire.pack(media_type, columns, **metadata)
+    return bodies
+
+
+def main():
+    """Print the bytes per point of each wire format and content coding."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--points", type=int, default=2_000)
+    args = parser.parse_args()
+    codings = (None, "gzip") if wire.brotli is None else (None, "gzip", "br")
+    print(f"{'':>44} " + " ".join(f"{coding or 'identity':>9}" for coding in codings))
+    for media_type, body in encodings(synthetic_day(args.points)).items():
+        print(
+            f"{media_type:>44} "
+            + " ".join(
+                f"{len(wire.compress(body, coding)) / args.points:9.2f}"
+                for coding in codings
+            )
+        )
+    print("(bytes per point)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,35 @@
+import contextlib
 import datetime
+import functools
 import os
-from typing import Annotated
+from typing import Annotated, Any, Iterable, Iterator
 
-from fastapi import FastAPI, HTTPException
+import numpy as np
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
+from sqlalchemy import Row
 
 import takeout_maps
 import takeout_maps.constants
 from takeout_maps import takeout as takeout_queries
-from takeout_maps.api import serving
-from takeout_maps.routes import fitbit, takeout
+from takeout_maps.api import caching, serving, streaming, wire
+from takeout_maps.api.takeout import records
+from takeout_maps.routes import fitbit, index, takeout, tiles
+from takeout_maps.takeout import arrays
+from takeout_maps.takeout import index as takeout_index
+from takeout_maps.takeout import utils as takeout_utils
 
-app = FastAPI()
+
+@contextlib.asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Build the indexes in the background while the app is serving."""
+    takeout_index.indexer.start()
+    yield
+
+
+app = FastAPI(lifespan=lifespan)
 app.mount(
     "/static",
     StaticFiles(directory=os.path.join(takeout_maps.constants.PACKAGE_ROOT, "static")),
@@ -33,6 +50,8 @@ app.add_middleware(
 
 app.include_router(fitbit.router)
 app.include_router(takeout.router)
+app.include_router(tiles.router)
+app.include_router(index.router)
 
 
 @app.get(
@@ -48,38 +67,314 @@ def list_connections():
     ]
 
 
-@app.get("/locations/{date}.json")
+@app.get("/database/pools")
+def database_pools() -> dict[str, dict[str, int]]:
+    """Get the state of the database connection pools."""
+    return takeout_index.pool_statistics()
+
+
+@app.get("/calendar.json", response_model=serving.Calendar)
+async def calendar(request: Request) -> Response:
+    """Get the summary of every day that has locations."""
+    return await caching.respond(
+        request, await takeout_queries.arecords_version(), ("calendar",), _calendar
+    )
+
+
+async def _calendar() -> serving.Calendar:
+    """Render the calendar."""
+    return serving.Calendar(
+        days=[
+            serving.DaySummary(
+                date=summary.date,
+                count=summary.point_count,
+                min_latitude=summary.min_latitude_e7 / 1e7,
+                max_latitude=summary.max_latitude_e7 / 1e7,
+                min_longitude=summary.min_longitude_e7 / 1e7,
+                max_longitude=summary.max_longitude_e7 / 1e7,
+                start=summary.first_timestamp.replace(tzinfo=datetime.timezone.utc),
+                end=summary.last_timestamp.replace(tzinfo=datetime.timezone.utc),
+                distance=summary.distance_m,
+                activity=summary.dominant_activity,
+            )
+            for summary in await takeout_queries.adaily_summaries()
+        ],
+        start=takeout.all_range()[0].date(),
+        end=takeout.all_range()[1].date(),
+    )
+
+
+def _location(row: Row) -> dict[str, Any]:
+    """Convert a location row to the fields of `serving.Location`."""
+    return dict(
+        latitude=row.latitude_e7 / 1e7,
+        longitude=row.longitude_e7 / 1e7,
+        timestamp=row.timestamp.replace(tzinfo=datetime.timezone.utc),
+        accuracy=row.accuracy,
+        altitude=row.altitude,
+    )
+
+
+def _locations_from_arrays(locations: arrays.LocationArrays) -> list[dict[str, Any]]:
+    """Convert location arrays to the fields of `serving.Location`."""
+    altitudes = locations.altitude.astype(object)
+    altitudes[np.isnan(locations.altitude)] = None
+    accuracies = locations.accuracy.astype(object)
+    accuracies[locations.accuracy == arrays.MISSING_ACCURACY] = None
+    return [
+        dict(
+            latitude=latitude,
+            longitude=longitude,
+            timestamp=timestamp.replace(tzinfo=datetime.timezone.utc),
+            accuracy=accuracy,
+            altitude=altitude,
+        )
+        for latitude, longitude, timestamp, accuracy, altitude in zip(
+            (locations.latitude_e7 / 1e7).tolist(),
+            (locations.longitude_e7 / 1e7).tolist(),
+            locations.epoch_ms.astype("datetime64[ms]").tolist(),
+            accuracies.tolist(),
+            altitudes.tolist(),
+        )
+    ]
+
+
+def _chunk_arrays(
+    locations: arrays.LocationArrays, chunk_size: int
+) -> Iterator[list[dict[str, Any]]]:
+    """Convert location arrays to the fields of `serving.Location` in chunks."""
+    for i in range(0, len(locations), chunk_size):
+        yield _locations_from_arrays(locations.take(slice(i, i + chunk_size)))
+
+
+@app.get("/locations/{date}.json", response_model=serving.LocationData)
 async def locations(
-    date: Annotated[datetime.date, takeout.ValidRange],
-) -> serving.LocationData:
+    request: Request,
+    date: datetime.date,
+    stream: bool = False,
+    zoom: Annotated[int | None, Query(ge=0, le=24)] = None,
+    simplify: Annotated[float, Query(gt=0)] = 1.0,
+) -> Response:
+    """Get the locations for a date.
+
+    If `zoom` is given, the path is simplified to within `simplify` pixels at that
+    zoom level. Responses are cached, and past days may be reused by clients. The
+    locations may also be sent in the compact formats of `wire`, as negotiated
+    with the `Accept` header.
+    """
     try:
-        takeout.ValidRange(date)
+        takeout.valid_range()(date)
     except ValueError as e:
         raise HTTPException(
             404,
             detail=serving.ExceptionDetail(
                 errorMessage="The date is out of range.",
                 errorID="date-out-of-range",
-                start=str(takeout.all_range[0]),
-                end=str(takeout.all_range[1]),
+                start=str(takeout.all_range()[0]),
+                end=str(takeout.all_range()[1]),
             ).model_dump(),
         ) from e
+    media_type = wire.accepted(
+        request, wire.JSON, wire.MSGPACK, wire.ARROW, wire.POLYLINE
+    )
+    start, end = takeout.all_range()[0].date(), takeout.all_range()[1].date()
+    return await caching.respond(
+        request,
+        await takeout_queries.arecords_version(),
+        ("locations", date, zoom, simplify),
+        (
+            functools.partial(_locations, date, stream, zoom, simplify, start, end)
+            if media_type == wire.JSON
+            else functools.partial(
+                _packed_locations, media_type, date, zoom, simplify, start, end
+            )
+        ),
+        historical=date < end,
+        media_type=media_type,
+    )
+
+
+async def _locations(
+    date: datetime.date,
+    stream: bool,
+    zoom: int | None,
+    simplify: float,
+    start: datetime.date,
+    end: datetime.date,
+) -> serving.LocationData | StreamingResponse:
+    """Render the locations for a date."""
+    if zoom is not None:
+        return serving.LocationData(
+            locations=_locations_from_arrays(
+                await takeout_queries.asimplified_location_arrays_by_date(
+                    date, zoom, simplify
+                )
+            ),
+            start=start,
+            end=end,
+        )
+    if stream:
+        return StreamingResponse(
+            streaming.stream_model(
+                serving.LocationData,
+                "locations",
+                (
+                    [_location(row) for row in rows]
+                    for rows in takeout_queries.iter_location_rows_by_range(
+                        date, date + datetime.timedelta(days=1)
+                    )
+                ),
+                start=start,
+                end=end,
+            ),
+            media_type="application/json",
+        )
     return serving.LocationData(
         locations=[
-            serving.Location(
-                latitude=location.latitude_e7 / 1e7,
-                longitude=location.longitude_e7 / 1e7,
-                timestamp=location.timestamp,
-                accuracy=location.accuracy,
-                altitude=location.accuracy,
-            )
-            for location in takeout_queries.records_by_date(date).locations
+            serving.Location(**_location(location))
+            for location in await takeout_queries.alocation_rows_by_date(date)
         ],
-        start=takeout.all_range[0].date(),
-        end=takeout.all_range[1].date(),
+        start=start,
+        end=end,
+    )
+
+
+def _location_columns(locations: arrays.LocationArrays) -> dict[str, np.ndarray]:
+    """Convert location arrays to the columns of the compact formats."""
+    return dict(
+        timestamp=locations.epoch_ms.astype("datetime64[ms]"),
+        latitude_e7=locations.latitude_e7,
+        longitude_e7=locations.longitude_e7,
+        accuracy=np.ma.masked_equal(locations.accuracy, arrays.MISSING_ACCURACY),
+        altitude=np.ma.masked_invalid(locations.altitude),
     )
 
 
+async def _packed_locations(
+    media_type: str,
+    date: datetime.date,
+    zoom: int | None,
+    simplify: float,
+    start: datetime.date,
+    end: datetime.date,
+) -> bytes:
+    """Render the locations for a date in a compact format."""
+    if zoom is not None:
+        locations = await takeout_queries.asimplified_location_arrays_by_date(
+            date, zoom, simplify
+        )
+    else:
+        locations = await takeout_queries.alocation_arrays_by_date(date)
+    if media_type == wire.POLYLINE:
+        return wire.polyline(
+            locations.latitude_e7,
+            locations.longitude_e7,
+            locations.epoch_ms,
+            start=start,
+            end=end,
+        )
+    return wire.pack(media_type, _location_columns(locations), start=start, end=end)
+
+
+@app.get("/locations/range", response_model=serving.LocationData)
+async def locations_range(
+    start: datetime.datetime,
+    end: datetime.datetime,
+    limit: Annotated[int | None, Query(gt=0)] = None,
+    zoom: Annotated[int | None, Query(ge=0, le=24)] = None,
+    simplify: Annotated[float, Query(gt=0)] = 1.0,
+    chunk_size: Annotated[int, Query(gt=0, le=100_000)] = 10_000,
+) -> StreamingResponse:
+    """Stream the locations between two timestamps.
+
+    If `zoom` is given, the path is simplified to within `simplify` pixels at that
+    zoom level. If there would be more than `limit` locations, they are downsampled
+    evenly to at most `limit`. Timestamps without an offset are taken as UTC.
+    """
+    start, end = takeout_utils.utc(start), takeout_utils.utc(end)
+    if end <= start:
+        raise HTTPException(422, detail="The end must be after the start.")
+    if zoom is not None:
+        simplified = await takeout_queries.asimplified_location_arrays_by_range(
+            start, end, zoom, simplify
+        )
+        if limit is not None:
+            simplified = simplified.downsample(limit)
+        chunks: Iterable[list[dict[str, Any]]] = _chunk_arrays(simplified, chunk_size)
+    else:
+        every = 1
+        if limit is not None:
+            every = max(
+                1,
+                -(
+                    -await takeout_queries.acount_locations_by_range(start, end)
+                    // limit
+                ),
+            )
+        chunks = (
+            [_location(row) for row in rows]
+            for rows in takeout_queries.iter_location_rows_by_range(
+                start, end, chunk_size=chunk_size, every=every
+            )
+        )
+    return StreamingResponse(
+        streaming.stream_model(
+            serving.LocationData,
+            "locations",
+            chunks,
+            start=takeout.all_range()[0].date(),
+            end=takeout.all_range()[1].date(),
+        ),
+        media_type="application/json",
+    )
+
+
+@app.get("/locations/bbox", response_model=serving.LocationData)
+async def locations_bbox(
+    west: Annotated[float, Query(ge=-180, le=180)],
+    south: Annotated[float, Query(ge=-90, le=90)],
+    east: Annotated[float, Query(ge=-180, le=180)],
+    north: Annotated[float, Query(ge=-90, le=90)],
+    start: datetime.datetime | None = None,
+    end: datetime.datetime | None = None,
+    limit: Annotated[int | None, Query(gt=0)] = None,
+    chunk_size: Annotated[int, Query(gt=0, le=100_000)] = 10_000,
+) -> StreamingResponse:
+    """Stream the locations within a bounding box, optionally between two timestamps.
+
+    If `west > east` the box crosses the antimeridian. If there would be more than
+    `limit` locations, they are downsampled evenly to at most `limit`.
+    """
+    if south > north:
+        raise HTTPException(422, detail="The south must not be north of the north.")
+    locations = await takeout_queries.arecords_in_bbox(
+        arrays.BoundingBox(west=west, south=south, east=east, north=north),
+        start=start,
+        end=end,
+    )
+    if limit is not None:
+        locations = locations.downsample(limit)
+    return StreamingResponse(
+        streaming.stream_model(
+            serving.LocationData,
+            "locations",
+            _chunk_arrays(locations, chunk_size),
+            start=takeout.all_range()[0].date(),
+            end=takeout.all_range()[1].date(),
+        ),
+        media_type="application/json",
+    )
+
+
+@app.get("/locations/record/{id}.json")
+async def location_record(id: int) -> records.Location:
+    """Get a location record by its id."""
+    record = await takeout_queries.arecord_by_id(id)
+    if record is None:
+        raise HTTPException(404)
+    return record
+
+
 if __name__ == "__main__":
     import uvicorn
 
@@ -0,0 +1,225 @@
+"""Caching of rendered responses, with HTTP validators.
+
+Responses are keyed by the version of the index along with the request, so a new
+index starts a fresh cache. Bodies are kept in memory up to a byte budget, least
+recently used first out, and optionally on disk up to a larger budget.
+"""
+import collections
+import contextlib
+import hashlib
+import os
+import threading
+from typing import Awaitable, Callable, Hashable
+
+import pydantic
+from fastapi import Request, Response
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
+import takeout_maps.constants
+from takeout_maps.api import wire
+
+HISTORICAL_MAX_AGE = 86_400
+"""How long clients may reuse the data of a past day without revalidating it."""
+
+
+class ResponseCache:
+    """LRU cache of response bodies with a byte budget, and an optional disk tier.
+
+    The disk tier has its own budget. Once it is exceeded, the least recently used
+    bodies on disk are deleted until it is half full, so the bodies of the previous
+    versions of the index are eventually dropped.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        directory: str | None = None,
+        max_disk_bytes: int = 1 << 30,
+    ) -> None:
+        """Create an empty cache, kept on disk too if `directory` is given."""
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self.size = 0
+        self.disk_size: int | None = None
+        self._bodies: collections.OrderedDict[str, bytes] = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> str | None:
+        if self.directory is None:
+            return None
+        return os.path.join(self.directory, key[:2], f"{key}.bin")
+
+    def get(self, key: str) -> bytes | None:
+        """Get a body, promoting it to memory if it was only on disk."""
+        with self._lock:
+            if key in self._bodies:
+                self._bodies.move_to_end(key)
+                return self._bodies[key]
+        path = self._path(key)
+        if path is None or not os.path.exists(path):
+            return None
+        try:
+            with open(path, "rb") as fp:
+                body = fp.read()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        self._remember(key, body)
+        return body
+
+    def put(self, key: str, body: bytes):
+        """Store a body in memory and on disk, evicting the least recently used."""
+        self._remember(key, body)
+        path = self._path(key)
+        if path is not None:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(f"{path}.{os.getpid()}.{threading.get_ident()}", "wb") as fp:
+                fp.write(body)
+            os.replace(f"{path}.{os.getpid()}.{threading.get_ident()}", path)
+            with self._lock:
+                if self.disk_size is not None:
+                    self.disk_size += len(body)
+                if self.disk_size is None or self.disk_size > self.max_disk_bytes:
+                    self._trim_disk()
+
+    def _trim_disk(self):
+        """Measure the disk tier, deleting the least recently used bodies if needed."""
+        if self.directory is None:
+            return
+        entries = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if name.endswith(".bin"):
+                    path = os.path.join(root, name)
+                    with contextlib.suppress(FileNotFoundError):
+                        stat = os.stat(path)
+                        entries.append((stat.st_mtime, stat.st_size, path))
+        self.disk_size = sum(size for _, size, _ in entries)
+        if self.disk_size <= self.max_disk_bytes:
+            return
+        for _, size, path in sorted(entries):
+            if self.disk_size <= self.max_disk_bytes // 2:
+                break
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+            self.disk_size -= size
+
+    def _remember(self, key: str, body: bytes):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._bodies:
+                self.size -= len(self._bodies.pop(key))
+            self._bodies[key] = body
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                self.size -= len(self._bodies.popitem(last=False)[1])
+
+    def clear(self):
+        """Forget the bodies held in memory."""
+        with self._lock:
+            self._bodies.clear()
+            self.size = 0
+
+
+cache = ResponseCache(
+    takeout_maps.constants.RESPONSE_CACHE_BYTES,
+    takeout_maps.constants.RESPONSE_CACHE_PATH,
+    takeout_maps.constants.RESPONSE_CACHE_DISK_BYTES,
+)
+
+
+def etag(version: str, key: Hashable) -> str:
+    """Get the entity tag of a response."""
+    return hashlib.sha256(f"{version}:{key!r}".encode()).hexdigest()[:32]
+
+
+def _matches(request: Request, tag: str) -> bool:
+    """Check whether the client already has the response with an entity tag."""
+    header = request.headers.get("if-none-match")
+    if header is None:
+        return False
+    tags = [value.strip().removeprefix("W/").strip('"') for value in header.split(",")]
+    return "*" in tags or tag in tags
+
+
+async def respond(
+    request: Request,
+    version: str,
+    key: Hashable,
+    render: Callable[[], Awaitable[pydantic.BaseModel | StreamingResponse | bytes]],
+    historical: bool = False,
+    media_type: str = wire.JSON,
+    store: bool = True,
+) -> Response:
+    """Respond with a cached body, rendering and caching it if needed.
+
+    Clients sending the entity tag in `If-None-Match` get a 304 without a body.
+    `historical` responses may be reused by clients for a day, otherwise they have
+    to revalidate each time. A streamed response is still streamed, and cached
+    once it has been sent in full. Bodies are compressed if the client accepts it,
+    each media type and content coding being cached apart. Responses that are not
+    worth keeping can still be validated without being `store`d.
+    """
+    coding = wire.coding(request.headers.get("accept-encoding"))
+    tag = etag(version, (key, media_type, coding))
+    headers = {
+        "ETag": f'"{tag}"',
+        "Cache-Control": (
+            f"public, max-age={HISTORICAL_MAX_AGE}" if historical else "no-cache"
+        ),
+        "Vary": "Accept, Accept-Encoding",
+    }
+    if coding is not None:
+        headers["Content-Encoding"] = coding
+    if _matches(request, tag):
+        return Response(status_code=304, headers=headers)
+    body = await run_in_threadpool(cache.get, tag) if store else None
+    if body is not None:
+        return Response(body, media_type=media_type, headers=headers)
+    rendered = await render()
+    if isinstance(rendered, StreamingResponse):
+        rendered.headers.update(headers)
+        if coding is not None:
+            rendered.body_iterator = _compressed(rendered.body_iterator, coding)
+        if store:
+            rendered.body_iterator = _tee(rendered.body_iterator, tag)
+        return rendered
+    if isinstance(rendered, pydantic.BaseModel):
+        rendered = rendered.model_dump_json().encode()
+    body = await run_in_threadpool(wire.compress, rendered, coding)
+    if store:
+        await run_in_threadpool(cache.put, tag, body)
+    return Response(body, media_type=media_type, headers=headers)
+
+
+async def _compressed(chunks, coding: str):
+    """Compress the chunks of a body."""
+    compress, flush = wire.compressor(coding)
+    async for chunk in chunks:
+        if compressed := compress(
+            chunk if isinstance(chunk, bytes) else chunk.encode()
+        ):
+            yield compressed
+    yield flush()
+
+
+async def _tee(chunks, key: str):
+    """Pass on the chunks of a body, caching it once it is complete.
+
+    Bodies larger than the cache are not kept, so they stop being buffered as soon
+    as they outgrow it.
+    """
+    body: list[bytes] | None = []
+    size = 0
+    async for chunk in chunks:
+        if body is not None:
+            body.append(chunk if isinstance(chunk, bytes) else chunk.encode())
+            size += len(body[-1])
+            if size > cache.max_bytes:
+                body = None
+        yield chunk
+    if body is not None:
+        await run_in_threadpool(cache.put, key, b"".join(body))
@@ -0,0 +1,70 @@
+"""Array-backed views of the Fitbit intraday datasets."""
+import dataclasses
+import datetime
+from typing import Any
+
+import numpy as np
+
+
+@dataclasses.dataclass(frozen=True)
+class IntradayArrays:
+    """An intraday dataset stored as a struct of contiguous arrays.
+
+    The intervals are naive, in the local time of the user.
+    """
+
+    start: np.ndarray
+    end: np.ndarray
+    value: np.ndarray
+
+    @classmethod
+    def parse(cls, response: dict[str, Any], resource: str) -> "IntradayArrays":
+        """Parse the intraday dataset of a resource from a Fitbit response.
+
+        The `HH:MM:SS` times are parsed from their digits in one pass, rather than
+        row by row.
+        """
+        date = np.datetime64(response[f"activities-{resource}"][0]["dateTime"], "s")
+        intraday = response[f"activities-{resource}-intraday"]
+        interval = np.timedelta64(
+            datetime.timedelta(
+                **{intraday["datasetType"] + "s": intraday["datasetInterval"]}
+            ),
+            "s",
+        )
+        dataset = intraday["dataset"]
+        times = np.array([row["time"] for row in dataset], dtype="S8")
+        digits = times.view(np.uint8).reshape(-1, 8).astype(np.int64) - ord("0")
+        seconds = (
+            (digits[:, 0] * 10 + digits[:, 1]) * 3600
+            + (digits[:, 3] * 10 + digits[:, 4]) * 60
+            + digits[:, 6] * 10
+            + digits[:, 7]
+        )
+        start = date + seconds.astype("timedelta64[s]")
+        return cls(
+            start=start,
+            end=start + interval,
+            value=np.fromiter(
+                (row["value"] for row in dataset), dtype=np.int64, count=len(dataset)
+            ),
+        )
+
+    def __len__(self) -> int:
+        """Get the number of rows."""
+        return len(self.value)
+
+    def to_json(self) -> bytes:
+        """Serialize the rows as comma separated JSON objects.
+
+        Each row is serialized as the serving models would, with its `start`, `end`
+        and `value`.
+        """
+        return ",".join(
+            f'{{"start":"{start}","end":"{end}","value":{value}}}'
+            for start, end, value in zip(
+                np.datetime_as_string(self.start, unit="s").tolist(),
+                np.datetime_as_string(self.end, unit="s").tolist(),
+                self.value.tolist(),
+            )
+        ).encode()
@@ -0,0 +1,245 @@
+"""Caching of the Fitbit intraday datasets, and rate limiting of fetching them.
+
+Datasets are stored in the index database, keyed by the user, the resource, the
+date and the detail level. A day fetched after it ended is complete, so is kept
+for good, while one fetched during the day is refetched once it is older than
+`takeout_maps.constants.FITBIT_TODAY_TTL`. Fetches are limited by a token bucket
+per user, sized to the Fitbit rate limit, and concurrent fetches of the same
+dataset share a single request. When the bucket is empty, a stale dataset is
+served rather than waiting for a token.
+"""
+import asyncio
+import datetime
+import functools
+import json
+import threading
+import time
+from typing import Any, Awaitable, Callable, NamedTuple
+
+import sqlalchemy
+from loguru import logger
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+import takeout_maps.constants
+from takeout_maps.takeout import index, models
+
+
+class Key(NamedTuple):
+    """The key of an intraday dataset."""
+
+    user_id: str
+    resource: str
+    date: datetime.date
+    detail_level: str
+
+    @classmethod
+    def parse(cls, user_id: str, resource: str, date: str, detail_level: str) -> "Key":
+        """Get the key of a dataset, resolving `"today"` to the date."""
+        return cls(
+            user_id,
+            resource,
+            (
+                datetime.date.today()
+                if date == "today"
+                else datetime.date.fromisoformat(date)
+            ),
+            detail_level,
+        )
+
+
+class TokenBucket:
+    """Rate limiter allowing up to `capacity` requests per `period` seconds."""
+
+    def __init__(self, capacity: int, period: float) -> None:
+        """Start with a full bucket, so a first burst is not delayed."""
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    def available(self) -> bool:
+        """Check whether a token can be taken without waiting."""
+        self._refill()
+        return self.tokens >= 1 and not self._lock.locked()
+
+    async def acquire(self):
+        """Take a token, waiting for one if needed. Waiters are served in order."""
+        async with self._lock:
+            self._refill()
+            while self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= 1
+
+
+_buckets: dict[str, TokenBucket] = {}
+_inflight: dict[Key, asyncio.Future] = {}
+
+
+def bucket(user_id: str) -> TokenBucket:
+    """Get the token bucket of a user."""
+    if user_id not in _buckets:
+        _buckets[user_id] = TokenBucket(
+            takeout_maps.constants.FITBIT_RATE_LIMIT,
+            takeout_maps.constants.FITBIT_RATE_PERIOD,
+        )
+    return _buckets[user_id]
+
+
+_table_lock = threading.Lock()
+
+
+@functools.cache
+def _create_table():
+    models.FitbitIntraday.__table__.create(bind=index.engine(), checkfirst=True)
+
+
+def _engine() -> sqlalchemy.Engine:
+    """Get the engine of the cache, creating its table the first time."""
+    with _table_lock:
+        _create_table()
+    return index.engine()
+
+
+def _load(key: Key) -> tuple[datetime.datetime, dict[str, Any]] | None:
+    """Load a dataset from the cache, with when it was fetched."""
+    table = models.FitbitIntraday
+    with Session(_engine()) as session:
+        row = session.execute(
+            select(table.fetched_on, table.json).where(
+                table.user_id == key.user_id,
+                table.resource == key.resource,
+                table.date == key.date,
+                table.detail_level == key.detail_level,
+            )
+        ).first()
+    if row is None:
+        return None
+    return row.fetched_on, json.loads(row.json)
+
+
+def _store(key: Key, fetched_on: datetime.datetime, response: dict[str, Any]):
+    """Store a dataset in the cache."""
+    table = models.FitbitIntraday
+    values = dict(
+        **key._asdict(),
+        fetched_on=fetched_on,
+        json=json.dumps(response, separators=(",", ":")),
+    )
+    try:
+        with Session(_engine()) as session, session.begin():
+            session.execute(
+                insert(table)
+                .values(**values)
+                .on_conflict_do_update(
+                    index_elements=list(Key._fields),
+                    set_=dict(fetched_on=fetched_on, json=values["json"]),
+                )
+            )
+    except sqlalchemy.exc.OperationalError as e:
+        # The index may be being built, the dataset is fetched again next time.
+        logger.warning(f"Could not cache the Fitbit dataset {key}: {e}")
+
+
+def is_fresh(key: Key, fetched_on: datetime.datetime) -> bool:
+    """Check whether a cached dataset can be served without refetching it."""
+    return fetched_on.date() > key.date or (
+        datetime.datetime.now() - fetched_on
+    ) < datetime.timedelta(seconds=takeout_maps.constants.FITBIT_TODAY_TTL)
+
+
+async def fetch(
+    key: Key, request: Callable[[], Awaitable[dict[str, Any]]], stale: bool = True
+) -> dict[str, Any]:
+    """Get an intraday dataset from the cache, or with `request` if needed.
+
+    If `stale`, a stale dataset may be served when the rate limit is reached.
+    """
+    cached = await run_in_threadpool(_load, key)
+    if cached is not None:
+        fetched_on, response = cached
+        if is_fresh(key, fetched_on) or (
+            stale and key not in _inflight and not bucket(key.user_id).available()
+        ):
+            return response
+    if key not in _inflight:
+        _inflight[key] = asyncio.ensure_future(_request(key, request))
+        _inflight[key].add_done_callback(lambda _: _inflight.pop(key, None))
+    # Shielded, so a client going away does not cancel the request for the others.
+    return await asyncio.shield(_inflight[key])
+
+
+async def _request(
+    key: Key, request: Callable[[], Awaitable[dict[str, Any]]]
+) -> dict[str, Any]:
+    """Request a dataset within the rate limit, and cache it."""
+    await bucket(key.user_id).acquire()
+    fetched_on = datetime.datetime.now()
+    response = await request()
+    await run_in_threadpool(_store, key, fetched_on, response)
+    return response
+
+
+class Backfill:
+    """Prefetches the intraday datasets of a range of dates in the background.
+
+    Datasets that are cached and fresh are not fetched again, so a backfill that
+    was interrupted resumes where it stopped when it is started again.
+    """
+
+    def __init__(self) -> None:
+        """Create an idle backfill."""
+        self.keys: list[Key] = []
+        self.done: set[Key] = set()
+        self.errors: dict[Key, str] = {}
+        self._task: asyncio.Task | None = None
+
+    @property
+    def running(self) -> bool:
+        """Whether a backfill is in progress."""
+        return self._task is not None and not self._task.done()
+
+    def start(
+        self,
+        keys: list[Key],
+        request: Callable[[Key], Callable[[], Awaitable[dict[str, Any]]]],
+        concurrency: int,
+    ):
+        """Start fetching the datasets, at most `concurrency` at a time."""
+        if self.running:
+            raise RuntimeError("A backfill is already in progress.")
+        self.keys, self.done, self.errors = keys, set(), {}
+        self._task = asyncio.ensure_future(self._run(request, concurrency))
+
+    async def _run(
+        self,
+        request: Callable[[Key], Callable[[], Awaitable[dict[str, Any]]]],
+        concurrency: int,
+    ):
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def backfill(key: Key):
+            async with semaphore:
+                try:
+                    await fetch(key, request(key), stale=False)
+                except Exception as e:
+                    logger.exception(e)
+                    self.errors[key] = repr(e)
+                else:
+                    self.done.add(key)
+
+        await asyncio.gather(*(backfill(key) for key in self.keys))
+
+
+backfill = Backfill()
@@ -1,3 +1,4 @@
 from takeout_maps.api.serving.common import *
 from takeout_maps.api.serving.fitbit import *
+from takeout_maps.api.serving.index import *
 from takeout_maps.api.serving.takeout import *
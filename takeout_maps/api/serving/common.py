@@ -6,7 +6,7 @@ import pydantic
 
 from takeout_maps.api.takeout import semantic_location_history
 
-ErrorIDs = Literal["date-out-of-range"]
+ErrorIDs = Literal["date-out-of-range", "not-acceptable"]
 
 T = TypeVar("T", bound=pydantic.BaseModel)
 S = TypeVar(
@@ -78,3 +78,26 @@ class LocationData(pydantic.BaseModel):
     locations: Sequence[Location]
     start: datetime.date
     end: datetime.date
+
+
+class DaySummary(pydantic.BaseModel):
+    """Summary of the locations recorded on a day."""
+
+    date: datetime.date
+    count: int
+    min_latitude: float
+    max_latitude: float
+    min_longitude: float
+    max_longitude: float
+    start: datetime.datetime
+    end: datetime.datetime
+    distance: float
+    activity: str | None = None
+
+
+class Calendar(pydantic.BaseModel):
+    """Summaries of all the days with locations."""
+
+    days: Sequence[DaySummary]
+    start: datetime.date
+    end: datetime.date
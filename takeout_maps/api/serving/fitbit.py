@@ -25,3 +25,14 @@ class MinMax(pydantic.BaseModel, Generic[T]):
 
 class HeartrateMetadata(pydantic.BaseModel):
     zones: dict[Literal["out_of_range", "fat_burn", "cardio", "peak"], MinMax[int]]
+
+
+class BackfillStatus(pydantic.BaseModel):
+    """Progress of the backfill of the Fitbit intraday datasets, and its errors."""
+
+    running: bool
+    start: datetime.date | None = None
+    end: datetime.date | None = None
+    total: int
+    done: int
+    errors: dict[str, str]
@@ -0,0 +1,27 @@
+"""Serving models for the progress of the background indexing."""
+from typing import Sequence
+
+import pydantic
+
+
+class TableProgress(pydantic.BaseModel):
+    """Progress of the build of an indexed table."""
+
+    name: str
+    done: int | None = None
+    total: int | None = None
+
+
+class IndexProgress(pydantic.BaseModel):
+    """Progress of the build of an index, and its error if it failed."""
+
+    name: str
+    ready: bool
+    error: str | None = None
+    tables: Sequence[TableProgress]
+
+
+class IndexStatus(pydantic.BaseModel):
+    """Progress of the builds of all the indexes."""
+
+    indexes: Sequence[IndexProgress]
@@ -0,0 +1,56 @@
+"""Incremental serialization of the serving models."""
+import typing
+from typing import Any, Iterable, Iterator, Mapping, Sequence
+
+import pydantic
+
+
+def stream_model(
+    model: type[pydantic.BaseModel],
+    field: str,
+    chunks: Iterable[Sequence[Mapping[str, Any]]],
+    **values: Any,
+) -> Iterator[bytes]:
+    """Serialize a model as JSON, streaming the items of one of its sequences.
+
+    The output matches `model(**{field: [...], **values}).model_dump_json()`, but
+    only one chunk of items is validated and held in memory at a time.
+    """
+    (item_type,) = typing.get_args(model.model_fields[field].annotation)
+    items = pydantic.TypeAdapter(list[item_type])  # type: ignore[valid-type]
+    head, tail = _split(model, field, **values)
+    yield head
+    separator = b""
+    for chunk in chunks:
+        if not chunk:
+            continue
+        yield separator + items.dump_json(items.validate_python(chunk))[1:-1]
+        separator = b","
+    yield tail
+
+
+def dump_model(
+    model: type[pydantic.BaseModel], field: str, items: bytes, **values: Any
+) -> bytes:
+    """Serialize a model as JSON, with one sequence given as its serialized items.
+
+    The items of the sequence are given as their comma separated JSON. They are
+    neither validated nor turned into objects, so must already be serialized as the
+    model would.
+    """
+    head, tail = _split(model, field, **values)
+    return head + items + tail
+
+
+def _split(
+    model: type[pydantic.BaseModel], field: str, **values: Any
+) -> tuple[bytes, bytes]:
+    """Get the JSON of a model before and after the items of one of its sequences."""
+    placeholder = f'"{field}":[]'.encode()
+    head, tail = (
+        model.model_construct(**{field: [], **values})
+        .model_dump_json()
+        .encode()
+        .split(placeholder)
+    )
+    return head + placeholder[:-1], placeholder[-1:] + tail
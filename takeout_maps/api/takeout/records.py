@@ -75,7 +75,7 @@ class Location(pydantic.BaseModel):
     )
 
     source: str | None = None
-    accuracy: int
+    accuracy: int | None = None
     active_wifi_scan: WifiScan | None = pydantic.Field(
         alias="activeWifiScan", default=None
     )
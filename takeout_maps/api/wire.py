@@ -0,0 +1,231 @@
+"""Content negotiation of the wire formats and compression of responses.
+
+Besides JSON, data can be sent as columns, one array per field:
+
+* `MSGPACK`, a MessagePack map of `start`, `end` and `columns`, timestamps being
+  milliseconds since the epoch and missing values nil.
+* `ARROW`, an Arrow IPC stream of a single record batch, with `start` and `end`
+  in the metadata of its schema.
+* `POLYLINE`, for paths only, a JSON object whose `path` is the latitudes and
+  longitudes as a Google encoded polyline and whose `timestamps` are the seconds
+  since the epoch encoded the same way, one value per point. Both are rounded, to
+  5 decimal places and to the second.
+
+The binary formats need their optional dependencies, install
+`takeout-maps[wire]`. Responses are compressed with brotli, if installed, or gzip
+when the client accepts them.
+"""
+import gzip
+import json
+import zlib
+from typing import Any, Callable, Mapping, Sequence
+
+import numpy as np
+from fastapi import HTTPException, Request
+
+from takeout_maps.api import serving
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import pyarrow
+    import pyarrow.ipc
+except ImportError:
+    pyarrow = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+ARROW = "application/vnd.apache.arrow.stream"
+POLYLINE = "application/vnd.takeout-maps.polyline+json"
+
+POLYLINE_PRECISION = 5
+"""The number of decimal places of the coordinates in a polyline."""
+_POLYLINE_CHUNKS = 13
+"""The most 5-bit chunks needed to encode a 64-bit value in a polyline."""
+
+
+def available(*media_types: str) -> tuple[str, ...]:
+    """Filter the media types to those whose dependencies are installed."""
+    missing = {MSGPACK: msgpack is None, ARROW: pyarrow is None}
+    return tuple(
+        media_type for media_type in media_types if not missing.get(media_type)
+    )
+
+
+def accepted(request: Request, *media_types: str) -> str:
+    """Choose the media type to respond to a request with, of those available.
+
+    Raises a 406 if the client accepts none of them.
+    """
+    offered = available(*media_types)
+    media_type = negotiate(request.headers.get("accept"), offered)
+    if media_type is None:
+        raise HTTPException(
+            406,
+            detail=serving.ExceptionDetail(
+                errorMessage="None of the accepted media types are available.",
+                errorID="not-acceptable",
+                available=list(offered),
+            ).model_dump(),
+        )
+    return media_type
+
+
+def _preferences(header: str) -> dict[str, float]:
+    """Parse an `Accept` or `Accept-Encoding` header into each value's quality."""
+    preferences = {}
+    for value in header.split(","):
+        name, *parameters = (part.strip() for part in value.split(";"))
+        quality = 1.0
+        for parameter in parameters:
+            key, _, number = parameter.partition("=")
+            if key.strip() == "q":
+                try:
+                    quality = float(number)
+                except ValueError:
+                    quality = 0.0
+        if name:
+            preferences[name.lower()] = quality
+    return preferences
+
+
+def negotiate(accept: str | None, offered: Sequence[str]) -> str | None:
+    """Choose the media type to respond with, the first offered if there is a tie.
+
+    Returns `None` if the client accepts none of those offered.
+    """
+    if not accept:
+        return offered[0]
+    preferences = _preferences(accept)
+
+    def quality(media_type: str) -> float:
+        for name in (media_type, f"{media_type.split('/')[0]}/*", "*/*"):
+            if name in preferences:
+                return preferences[name]
+        return 0.0
+
+    best = max(offered, key=quality)
+    return best if quality(best) > 0 else None
+
+
+def coding(accept_encoding: str | None) -> str | None:
+    """Choose the content coding to compress a response with, if any."""
+    if not accept_encoding:
+        return None
+    preferences = _preferences(accept_encoding)
+    codings = ("br", "gzip") if brotli is not None else ("gzip",)
+    best = max(codings, key=lambda name: preferences.get(name, 0.0))
+    return best if preferences.get(best, 0.0) > 0 else None
+
+
+def compress(body: bytes, coding: str | None) -> bytes:
+    """Compress a body with a content coding."""
+    if coding is None:
+        return body
+    if coding == "br":
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6)
+
+
+def compressor(coding: str) -> tuple[Callable[[bytes], bytes], Callable[[], bytes]]:
+    """Get the functions to compress a body in chunks and to finish it."""
+    if coding == "br":
+        stream = brotli.Compressor(quality=5)
+        return stream.process, stream.finish
+    stream = zlib.compressobj(6, wbits=31)
+    return stream.compress, stream.flush
+
+
+def _polyline(values: np.ndarray) -> str:
+    """Encode rows of integers as a polyline, each column delta encoded."""
+    deltas = np.diff(values, axis=0, prepend=np.zeros_like(values[:1])).ravel()
+    zigzag = np.where(deltas < 0, ~(deltas << 1), deltas << 1).astype(np.uint64)
+    chunks = (
+        zigzag[:, None] >> np.arange(0, 5 * _POLYLINE_CHUNKS, 5, dtype=np.uint64)
+    ) & np.uint64(0x1F)
+    lengths = np.maximum(
+        1, np.count_nonzero(np.cumsum(chunks[:, ::-1], axis=1)[:, ::-1], axis=1)
+    )
+    positions = np.arange(_POLYLINE_CHUNKS)
+    chunks[positions < lengths[:, None] - 1] |= np.uint64(0x20)
+    return (
+        (chunks[positions < lengths[:, None]] + 63).astype(np.uint8).tobytes().decode()
+    )
+
+
+def polyline(
+    latitude_e7: np.ndarray,
+    longitude_e7: np.ndarray,
+    epoch_ms: np.ndarray,
+    **metadata: Any,
+) -> bytes:
+    """Encode a path as `POLYLINE`."""
+    scale = 10 ** (7 - POLYLINE_PRECISION)
+    coordinates = np.column_stack(
+        [
+            np.round(np.asarray(latitude_e7, dtype=np.int64) / scale),
+            np.round(np.asarray(longitude_e7, dtype=np.int64) / scale),
+        ]
+    ).astype(np.int64)
+    timestamps = np.asarray(epoch_ms, dtype=np.int64)[:, None] // 1000
+    return json.dumps(
+        {
+            **metadata,
+            "path": _polyline(coordinates),
+            "timestamps": _polyline(timestamps),
+        },
+        separators=(",", ":"),
+        default=str,
+    ).encode()
+
+
+def pack(media_type: str, columns: Mapping[str, np.ndarray], **metadata: Any) -> bytes:
+    """Encode columns as `MSGPACK` or `ARROW`.
+
+    Missing values are masked, with `numpy.ma`. The metadata is sent as strings,
+    and MessagePack floats in single precision.
+    """
+    metadata = {key: str(value) for key, value in metadata.items()}
+    if media_type == MSGPACK:
+        return msgpack.packb(
+            {
+                **metadata,
+                "columns": {
+                    name: (
+                        column.astype("datetime64[ms]").astype(np.int64)
+                        if np.issubdtype(column.dtype, np.datetime64)
+                        else column
+                    ).tolist()
+                    for name, column in columns.items()
+                },
+            },
+            use_single_float=True,
+        )
+    if media_type == ARROW:
+        table = pyarrow.table(
+            {
+                name: pyarrow.array(
+                    np.ma.getdata(column),
+                    mask=(
+                        np.ma.getmaskarray(column) if np.ma.is_masked(column) else None
+                    ),
+                    type=(
+                        pyarrow.timestamp("ms", tz="UTC")
+                        if np.issubdtype(column.dtype, np.datetime64)
+                        else None
+                    ),
+                )
+                for name, column in columns.items()
+            }
+        ).replace_schema_metadata(metadata)
+        sink = pyarrow.BufferOutputStream()
+        with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+    raise ValueError(f"Cannot pack columns as {media_type!r}.")
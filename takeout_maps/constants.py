@@ -9,6 +9,25 @@ from fitbit_web import auth
 import takeout_maps
 
 SQLALCHEMY_URL = "sqlite+pysqlite:///takeout.sqlite"
+POOL_SIZE = 8
+POOL_MAX_OVERFLOW = 8
+CACHED_STATEMENTS = 256
+QUERY_WORKERS = POOL_SIZE
+TILE_CACHE_PATH = "takeout_tiles"
+RESPONSE_CACHE_BYTES = 64 << 20
+RESPONSE_CACHE_PATH = os.getenv("TAKEOUT_MAPS_RESPONSE_CACHE_PATH")
+RESPONSE_CACHE_DISK_BYTES = int(
+    os.getenv("TAKEOUT_MAPS_RESPONSE_CACHE_DISK_BYTES", 1 << 30)
+)
+INDEX_WORKERS = int(os.getenv("TAKEOUT_MAPS_INDEX_WORKERS", os.cpu_count() or 1))
+JSON_BACKEND = os.getenv("TAKEOUT_MAPS_JSON_BACKEND")
+SIMDJSON_MAX_SIZE = 256 << 20
+JSON_COMPRESSION = os.getenv("TAKEOUT_MAPS_JSON_COMPRESSION")
+FITBIT_RATE_LIMIT = 150
+FITBIT_RATE_PERIOD = 3600
+FITBIT_TODAY_TTL = int(os.getenv("TAKEOUT_MAPS_FITBIT_TODAY_TTL", 300))
+FITBIT_BACKFILL_CONCURRENCY = 4
+FITBIT_DETAIL_LEVEL = "1min"
 
 
 MONTHS = (
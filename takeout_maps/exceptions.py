@@ -7,3 +7,23 @@ class NoFitbitAuthorizationError(HTTPException):
         super().__init__(
             401, "Fitbit authorization is required for this path.", headers
         )
+
+
+class IndexNotReadyError(HTTPException):
+    """An index is still being built, so the client should retry later."""
+
+    def __init__(self, index: str, retry_after: int = 5) -> None:
+        """Answer 503, asking to retry after `retry_after` seconds."""
+        super().__init__(
+            503,
+            f"The {index} index is still being built.",
+            {"Retry-After": str(retry_after)},
+        )
+
+
+class IndexFailedError(HTTPException):
+    """The background build of an index failed, so it will not become ready."""
+
+    def __init__(self, index: str, error: str) -> None:
+        """Answer 500, with the error that made the build fail."""
+        super().__init__(500, f"The {index} index could not be built: {error}")
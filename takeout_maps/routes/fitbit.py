@@ -1,12 +1,11 @@
 import datetime
 import os
-import re
 import typing
 import urllib.parse
-from typing import Annotated, Any, final
+from typing import Annotated, Any, Awaitable, Callable, Mapping, final
 
-from fastapi import APIRouter, Depends, Path, Request
-from fastapi.responses import FileResponse, HTMLResponse, RedirectResponse
+from fastapi import APIRouter, Depends, HTTPException, Path, Query, Request
+from fastapi.responses import FileResponse, HTMLResponse, RedirectResponse, Response
 from fastapi.security import OAuth2AuthorizationCodeBearer
 from fitbit_web import auth, client
 from pydantic import AnyUrl
@@ -14,9 +13,8 @@ from pydantic import AnyUrl
 import takeout_maps.api.serving.fitbit as fitbit_models
 import takeout_maps.constants
 from takeout_maps import exceptions
-from takeout_maps.api import serving
+from takeout_maps.api import fitbit_arrays, intraday, serving, streaming
 
-HMS = re.compile(r"(\d{2}):(\d{2}):(\d{2})")
 ZONES = {v: i for i, v in enumerate(("Out of Range", "Fat Burn", "Cardio", "Peak"))}
 
 
@@ -33,14 +31,19 @@ class FitbitAuth(OAuth2AuthorizationCodeBearer):
             scopes={k: k for k in typing.get_args(auth.Scope)},
         )
         self.__client = None
+        self.__user_id = "-"
         self.__redirect_path = urllib.parse.urlparse(auth.REDIRECT_URL).path
 
     def __call__(self, request: Request):
         if request.url.path == self.__redirect_path:
-            self.__client = client.Client(
-                tokens=auth.token_from_code(
-                    urllib.parse.parse_qs(request.url.query)["code"][0]
-                )
+            tokens = auth.token_from_code(
+                urllib.parse.parse_qs(request.url.query)["code"][0]
+            )
+            self.__client = client.Client(tokens=tokens)
+            self.__user_id = (
+                tokens["user_id"]
+                if isinstance(tokens, Mapping)
+                else getattr(tokens, "user_id", "-")
             )
         if self.__client is None:
             raise exceptions.NoFitbitAuthorizationError()
@@ -51,6 +54,12 @@ class FitbitAuth(OAuth2AuthorizationCodeBearer):
     def connected(self):
         return self.__client is not None
 
+    @final
+    @property
+    def user_id(self) -> str:
+        """The id of the connected user, or `-` for the current user."""
+        return self.__user_id
+
 
 router = APIRouter(prefix="/fitbit")
 
@@ -127,83 +136,145 @@ def init_client(request: Request):
     return {"success": True}
 
 
-@router.get("/steps/{date}.json")
-async def steps(
-    date: Annotated[str, Path(pattern=r"((\d{4}-\d{2}-\d{2})|today)")],
-    fitbit_client: Annotated[client.Client, Depends(fitbit_auth)],
-) -> serving.Dataset[fitbit_models.Steps, dict[str, Any]]:
-    response = await fitbit_client.aget_activities_resource_by_date_intraday(
-        date, detail_level="1min"
+def _intraday(
+    fitbit_client: client.Client, resource: str, date: str
+) -> Callable[[], Awaitable[dict[str, Any]]]:
+    """Get the function requesting an intraday dataset from Fitbit."""
+    if resource == "heart":
+        return lambda: fitbit_client.aget_heart_by_date_intraday(
+            date, detail_level=takeout_maps.constants.FITBIT_DETAIL_LEVEL
+        )
+    return lambda: fitbit_client.aget_activities_resource_by_date_intraday(
+        date, detail_level=takeout_maps.constants.FITBIT_DETAIL_LEVEL
     )
-    year, month, day = re.split(
-        r"(\d{4})-(\d{2})-(\d{2})", response["activities-steps"][0]["dateTime"]
-    )[1:-1]
-    end = datetime.timedelta(
-        **{
-            response["activities-steps-intraday"]["datasetType"]
-            + "s": response["activities-steps-intraday"]["datasetInterval"]
-        }
+
+
+def _backfill_status() -> fitbit_models.BackfillStatus:
+    return fitbit_models.BackfillStatus(
+        running=intraday.backfill.running,
+        start=min((key.date for key in intraday.backfill.keys), default=None),
+        end=max((key.date for key in intraday.backfill.keys), default=None),
+        total=len(intraday.backfill.keys),
+        done=len(intraday.backfill.done),
+        errors={
+            f"{key.resource}/{key.date}": error
+            for key, error in intraday.backfill.errors.items()
+        },
     )
 
-    def process_row(val: dict[str, Any]) -> fitbit_models.Steps:
-        hours, mins, secs = HMS.split(val["time"])[1:-1]
-        start = datetime.datetime(*(map(int, (year, month, day, hours, mins, secs))))
-        return fitbit_models.Steps(start=start, end=start + end, value=val["value"])
 
-    return serving.Dataset[fitbit_models.Steps, dict[str, Any]](
-        data=[
-            process_row(steps)
-            for steps in response["activities-steps-intraday"]["dataset"]
-        ]
+@router.post("/backfill")
+async def start_backfill(
+    start: datetime.date,
+    end: datetime.date,
+    fitbit_client: Annotated[client.Client, Depends(fitbit_auth)],
+    concurrency: Annotated[
+        int, Query(gt=0, le=16)
+    ] = takeout_maps.constants.FITBIT_BACKFILL_CONCURRENCY,
+) -> fitbit_models.BackfillStatus:
+    """Start prefetching the intraday steps and heart rate of a range of dates.
+
+    Once fetched, the layers of the range are served without touching the network.
+    Starting the same range again resumes an interrupted backfill.
+    """
+    if end < start:
+        raise HTTPException(422, detail="The end must not be before the start.")
+    if intraday.backfill.running:
+        raise HTTPException(409, detail="A backfill is already in progress.")
+    intraday.backfill.start(
+        [
+            intraday.Key(
+                fitbit_auth.user_id,
+                resource,
+                start + datetime.timedelta(days=day),
+                takeout_maps.constants.FITBIT_DETAIL_LEVEL,
+            )
+            for day in range((end - start).days + 1)
+            for resource in ("steps", "heart")
+        ],
+        lambda key: _intraday(fitbit_client, key.resource, key.date.isoformat()),
+        concurrency,
     )
+    return _backfill_status()
 
 
-@router.get("/heartrate/{date}.json")
-async def heartrate(
+@router.get("/backfill")
+def backfill_status() -> fitbit_models.BackfillStatus:
+    """Get the progress of the backfill."""
+    return _backfill_status()
+
+
+@router.get(
+    "/steps/{date}.json",
+    response_model=serving.Dataset[fitbit_models.Steps, dict[str, Any]],
+)
+async def steps(
     date: Annotated[str, Path(pattern=r"((\d{4}-\d{2}-\d{2})|today)")],
     fitbit_client: Annotated[client.Client, Depends(fitbit_auth)],
-) -> serving.Dataset[fitbit_models.Heartrate, fitbit_models.HeartrateMetadata]:
-    response = await fitbit_client.aget_heart_by_date_intraday(
-        date, detail_level="1min"
+) -> Response:
+    response = await intraday.fetch(
+        intraday.Key.parse(
+            fitbit_auth.user_id,
+            "steps",
+            date,
+            takeout_maps.constants.FITBIT_DETAIL_LEVEL,
+        ),
+        _intraday(fitbit_client, "steps", date),
     )
-    year, month, day = re.split(
-        r"(\d{4})-(\d{2})-(\d{2})", response["activities-heart"][0]["dateTime"]
-    )[1:-1]
-    end = datetime.timedelta(
-        **{
-            response["activities-heart-intraday"]["datasetType"]
-            + "s": response["activities-heart-intraday"]["datasetInterval"]
-        }
+    return Response(
+        streaming.dump_model(
+            serving.Dataset[fitbit_models.Steps, dict[str, Any]],
+            "data",
+            fitbit_arrays.IntradayArrays.parse(response, "steps").to_json(),
+        ),
+        media_type="application/json",
     )
 
-    def process_row(val: dict[str, Any]) -> fitbit_models.Heartrate:
-        hours, mins, secs = HMS.split(val["time"])[1:-1]
-        start = datetime.datetime(*(map(int, (year, month, day, hours, mins, secs))))
-        return fitbit_models.Heartrate(start=start, end=start + end, value=val["value"])
 
+@router.get(
+    "/heartrate/{date}.json",
+    response_model=serving.Dataset[
+        fitbit_models.Heartrate, fitbit_models.HeartrateMetadata
+    ],
+)
+async def heartrate(
+    date: Annotated[str, Path(pattern=r"((\d{4}-\d{2}-\d{2})|today)")],
+    fitbit_client: Annotated[client.Client, Depends(fitbit_auth)],
+) -> Response:
+    response = await intraday.fetch(
+        intraday.Key.parse(
+            fitbit_auth.user_id,
+            "heart",
+            date,
+            takeout_maps.constants.FITBIT_DETAIL_LEVEL,
+        ),
+        _intraday(fitbit_client, "heart", date),
+    )
     zones = sorted(
         response["activities-heart"][0]["value"]["heartRateZones"],
         key=lambda v: ZONES[v["name"]],
     )
-    return serving.Dataset[fitbit_models.Heartrate, fitbit_models.HeartrateMetadata](
-        data=[
-            process_row(measurement)
-            for measurement in response["activities-heart-intraday"]["dataset"]
-        ],
-        metadata=fitbit_models.HeartrateMetadata(
-            zones=dict(
-                out_of_range=fitbit_models.MinMax[int](
-                    min=zones[0]["min"], max=zones[0]["max"]
-                ),
-                fat_burn=fitbit_models.MinMax[int](
-                    min=zones[1]["min"], max=zones[1]["max"]
-                ),
-                cardio=fitbit_models.MinMax[int](
-                    min=zones[2]["min"], max=zones[2]["max"]
-                ),
-                peak=fitbit_models.MinMax[int](
-                    min=zones[3]["min"], max=zones[3]["max"]
-                ),
-            )
+    return Response(
+        streaming.dump_model(
+            serving.Dataset[fitbit_models.Heartrate, fitbit_models.HeartrateMetadata],
+            "data",
+            fitbit_arrays.IntradayArrays.parse(response, "heart").to_json(),
+            metadata=fitbit_models.HeartrateMetadata(
+                zones=dict(
+                    out_of_range=fitbit_models.MinMax[int](
+                        min=zones[0]["min"], max=zones[0]["max"]
+                    ),
+                    fat_burn=fitbit_models.MinMax[int](
+                        min=zones[1]["min"], max=zones[1]["max"]
+                    ),
+                    cardio=fitbit_models.MinMax[int](
+                        min=zones[2]["min"], max=zones[2]["max"]
+                    ),
+                    peak=fitbit_models.MinMax[int](
+                        min=zones[3]["min"], max=zones[3]["max"]
+                    ),
+                )
+            ),
         ),
+        media_type="application/json",
     )
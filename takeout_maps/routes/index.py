@@ -0,0 +1,28 @@
+"""Routes reporting the progress of the background indexing."""
+from fastapi import APIRouter
+
+from takeout_maps.api import serving
+from takeout_maps.takeout import index
+
+router = APIRouter(prefix="/index")
+
+
+@router.get("/status")
+def status() -> serving.IndexStatus:
+    """Get whether each index is ready, and the progress of each of its tables."""
+    return serving.IndexStatus(
+        indexes=[
+            serving.IndexProgress(
+                name=name,
+                ready=job["ready"],
+                error=job["error"],
+                tables=[
+                    serving.TableProgress(
+                        name=table, **dict(zip(("done", "total"), progress or ()))
+                    )
+                    for table, progress in job["tables"].items()
+                ],
+            )
+            for name, job in index.indexer.status().items()
+        ]
+    )
@@ -1,44 +1,136 @@
 import datetime
-from typing import Annotated
+from typing import Any
 
-from fastapi import APIRouter, HTTPException
+import numpy as np
+from fastapi import APIRouter, HTTPException, Request
 
 import takeout_maps.api.serving.takeout as takeout_models
 from takeout_maps import takeout
-from takeout_maps.api import serving, utils
+from takeout_maps.api import caching, serving, utils, wire
+from takeout_maps.api.takeout import semantic_location_history
 
 router = APIRouter(prefix="/takeout")
-all_range = takeout.records_range
 
 
-ValidRange = utils.ValidatableInterval(ge=all_range[0].date(), le=all_range[1].date())
+def all_range() -> tuple[datetime.datetime, datetime.datetime]:
+    """Get the first and last timestamps of the records."""
+    return takeout.records_range()
+
+
+def valid_range() -> utils.ValidatableInterval:
+    """Get the interval of dates that have records."""
+    start, end = all_range()
+    return utils.ValidatableInterval(ge=start.date(), le=end.date())
+
+
+async def _version() -> str:
+    """Get the version of the activities, which embed the range of the records."""
+    return f"{await takeout.atimeline_version()}-{await takeout.arecords_version()}"
+
+
+def _activities(
+    history: semantic_location_history.SemanticLocationHistory,
+) -> serving.Dataset[takeout_models.Activity, dict[str, Any]]:
+    """Get the activity segments of a semantic location history as a dataset.
+
+    Segments without a duration cannot be placed in time, so they are skipped.
+    """
+    return serving.Dataset[takeout_models.Activity, dict[str, Any]](
+        data=[
+            takeout_models.Activity(
+                id=object.id,
+                start=object.activity_segment.duration.start_timestamp,
+                end=object.activity_segment.duration.end_timestamp,
+                type=object.activity_segment.activity_type,
+            )
+            for object in history.timeline_objects
+            if object.activity_segment is not None
+            and object.activity_segment.duration is not None
+        ],
+        start=all_range()[0],
+        end=all_range()[1],
+    )
+
+
+def _epoch_ms(timestamps: list[datetime.datetime]) -> np.ndarray:
+    """Convert timestamps to an array of UTC milliseconds."""
+    return (
+        np.round(np.array([timestamp.timestamp() for timestamp in timestamps]) * 1000)
+        .astype(np.int64)
+        .astype("datetime64[ms]")
+    )
+
+
+def _encode(
+    activities: serving.Dataset[takeout_models.Activity, dict[str, Any]],
+    media_type: str,
+) -> serving.Dataset[takeout_models.Activity, dict[str, Any]] | bytes:
+    """Encode activities in a negotiated media type."""
+    if media_type == wire.JSON:
+        return activities
+    return wire.pack(
+        media_type,
+        dict(
+            id=np.array([activity.id for activity in activities.data], dtype=np.int64),
+            start=_epoch_ms([activity.start for activity in activities.data]),
+            end=_epoch_ms([activity.end for activity in activities.data]),
+            type=np.array(
+                [activity.type for activity in activities.data], dtype=object
+            ),
+        ),
+        start=activities.start,
+        end=activities.end,
+    )
 
 
 @router.get("/activities/{date}.json")
 async def activities(
-    date: Annotated[datetime.date, ValidRange],
+    request: Request,
+    date: datetime.date,
 ):
     try:
-        ValidRange(date)
+        valid_range()(date)
     except ValueError as e:
         raise HTTPException(404) from e
-    activities = [
-        (object.id, object.activity_segment)
-        for object in takeout.semantic_location_history_by_date(date).timeline_objects
-        if object.activity_segment is not None
-    ]
-    return serving.Dataset[takeout_models.Activity, dict](
-        data=[
-            takeout_models.Activity(
-                id=activity[0],
-                start=activity[1].duration.start_timestamp,
-                end=activity[1].duration.end_timestamp,
-                type=activity[1].activity_type,
-            )
-            for activity in activities
-        ],
-        start=all_range[0],
-        end=all_range[1],
+    media_type = wire.accepted(request, wire.JSON, wire.MSGPACK, wire.ARROW)
+
+    async def render():
+        return _encode(
+            _activities(await takeout.asemantic_location_history_by_date(date)),
+            media_type,
+        )
+
+    return await caching.respond(
+        request,
+        await _version(),
+        ("activities", date),
+        render,
+        historical=date < all_range()[1].date(),
+        media_type=media_type,
+    )
+
+
+@router.get("/activities/at/{timestamp}.json")
+async def activities_at(
+    request: Request,
+    timestamp: datetime.datetime,
+):
+    """Get the activities at a point in time."""
+    media_type = wire.accepted(request, wire.JSON, wire.MSGPACK, wire.ARROW)
+
+    async def render():
+        return _encode(
+            _activities(await takeout.asemantic_location_history_at(timestamp)),
+            media_type,
+        )
+
+    return await caching.respond(
+        request,
+        await _version(),
+        ("activities-at", timestamp),
+        render,
+        media_type=media_type,
+        store=False,
     )
 
 
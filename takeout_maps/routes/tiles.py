@@ -0,0 +1,81 @@
+"""Routes serving the heatmap tiles."""
+import json
+import os
+import shutil
+import threading
+from typing import Annotated
+
+from fastapi import APIRouter, HTTPException, Path
+from fastapi.responses import FileResponse, Response
+
+import takeout_maps.constants
+from takeout_maps import takeout
+from takeout_maps.takeout import tiles
+
+router = APIRouter(prefix="/tiles")
+
+MEDIA_TYPE = "application/geo+json"
+
+
+def _render(zoom: int, x: int, y: int) -> bytes:
+    """Render a heatmap tile.
+
+    Tiles up to `tiles.MAX_ZOOM` are read from the pre-aggregated counts, while
+    deeper tiles count the locations found through the spatial index on the same
+    grid, so every tile has at most `tiles.GRID ** 2` features.
+    """
+    if zoom <= tiles.MAX_ZOOM:
+        cells = takeout.heatmap_cells(zoom, x, y)
+    else:
+        locations = takeout.records_in_bbox(tiles.bounds(zoom, x, y))
+        cell_x, cell_y = tiles.cells(
+            locations.latitude_e7, locations.longitude_e7, zoom
+        )
+        inside = (cell_x // tiles.GRID == x) & (cell_y // tiles.GRID == y)
+        cells = tiles.count_cells(cell_x[inside], cell_y[inside])
+    return json.dumps(
+        tiles.feature_collection(zoom, *cells), separators=(",", ":")
+    ).encode()
+
+
+def _prune(version: str):
+    """Delete the tiles cached under the other heatmap versions."""
+    for entry in os.listdir(takeout_maps.constants.TILE_CACHE_PATH):
+        if entry != version:
+            shutil.rmtree(
+                os.path.join(takeout_maps.constants.TILE_CACHE_PATH, entry),
+                ignore_errors=True,
+            )
+
+
+@router.get("/{z}/{x}/{y}.json")
+def tile(
+    z: Annotated[int, Path(ge=0, le=24)],
+    x: Annotated[int, Path(ge=0)],
+    y: Annotated[int, Path(ge=0)],
+):
+    """Get a heatmap tile as GeoJSON.
+
+    Tiles are cached on disk under the current heatmap version, so adding records
+    to the index starts a fresh cache, and the tiles of the previous versions are
+    deleted.
+    """
+    if x >= 2**z or y >= 2**z:
+        raise HTTPException(404)
+    version = takeout.heatmap_version()
+    path = os.path.join(
+        takeout_maps.constants.TILE_CACHE_PATH, version, str(z), str(x), f"{y}.json"
+    )
+    if os.path.exists(path):
+        return FileResponse(path, media_type=MEDIA_TYPE)
+    content = _render(z, x, y)
+    fresh = not os.path.isdir(
+        os.path.join(takeout_maps.constants.TILE_CACHE_PATH, version)
+    )
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if fresh:
+        _prune(version)
+    with open(f"{path}.{os.getpid()}.{threading.get_ident()}", "wb") as fp:
+        fp.write(content)
+    os.replace(f"{path}.{os.getpid()}.{threading.get_ident()}", path)
+    return Response(content, media_type=MEDIA_TYPE)
@@ -1,13 +1,28 @@
 import datetime
-from typing import TypeVar
+import functools
+import hashlib
+from typing import Iterable, Iterator, Sequence, TypeVar, cast
 
+import numpy as np
 import pydantic
+import sqlalchemy
 from loguru import logger
-from sqlalchemy import and_, column, func, select, union_all
+from sqlalchemy import ColumnElement, Row, Select, and_, func, select
 from sqlalchemy.orm import Session
 
+import takeout_maps
 from takeout_maps.api.takeout import records, semantic_location_history
-from takeout_maps.takeout import index, models, utils
+from takeout_maps.takeout import (
+    arrays,
+    index,
+    intervals,
+    models,
+    paths,
+    simplify,
+    sources,
+    tiles,
+    utils,
+)
 
 BaseModel = TypeVar("BaseModel", bound=pydantic.BaseModel)
 
@@ -22,20 +37,15 @@ def validate_json_with_id(model: type[BaseModel]):
 
 
 @index.requires_records
-@index.inject_session()
+@index.inject_session(read_only=True)
 def records_by_date(session: Session, date: datetime.date) -> records.Records:
     """Get all the records for a date."""
     next_date = date + datetime.timedelta(days=1)
     try:
         db_result = (
             session.query(models.Record)
-            .filter(
-                and_(
-                    models.Record.timestamp >= date,
-                    models.Record.timestamp <= next_date,
-                ),
-            )
-            .order_by(models.Record.timestamp)
+            .filter(*_time_criteria(date, next_date), *_coordinate_criteria())
+            .order_by(models.Record.epoch_ms)
             .with_entities(models.Record.id, models.Record.json)
             .all()
         )
@@ -51,7 +61,239 @@ def records_by_date(session: Session, date: datetime.date) -> records.Records:
 
 
 @index.requires_records
-@index.inject_session()
+@index.inject_session(read_only=True)
+def location_rows_by_date(session: Session, date: datetime.date) -> Sequence[Row]:
+    """Get the typed location columns for a date, without parsing the json."""
+    next_date = date + datetime.timedelta(days=1)
+    return session.execute(
+        select(*models.LOCATION_COLUMNS)
+        .filter(*_time_criteria(date, next_date), *_coordinate_criteria())
+        .order_by(models.Record.epoch_ms)
+    ).all()
+
+
+@index.requires_records
+@index.inject_session(read_only=True)
+def location_rows_by_range(
+    session: Session,
+    start: datetime.datetime,
+    end: datetime.datetime | datetime.timedelta,
+) -> Sequence[Row]:
+    """Get the typed location columns for a date range, without parsing the json."""
+    if isinstance(end, datetime.timedelta):
+        end = start + end
+    start, end = sorted((start, end))
+    return session.execute(
+        select(*models.LOCATION_COLUMNS)
+        .filter(*_time_criteria(start, end), *_coordinate_criteria())
+        .order_by(models.Record.epoch_ms)
+    ).all()
+
+
+@index.requires_records
+@index.inject_session(read_only=True)
+def iter_location_rows_by_range(
+    session: Session,
+    start: datetime.datetime,
+    end: datetime.datetime | datetime.timedelta,
+    chunk_size: int = 10_000,
+    every: int = 1,
+) -> Iterator[Sequence[Row]]:
+    """Iterate over the typed location columns for a date range in chunks.
+
+    Rows are streamed from the database cursor, so only one chunk is held in memory
+    at a time. Only every `every`th row is kept, for downsampling.
+    """
+    if isinstance(end, datetime.timedelta):
+        end = start + end
+    start, end = sorted((start, end))
+    position = 0
+    for rows in session.execute(
+        select(*models.LOCATION_COLUMNS)
+        .filter(*_time_criteria(start, end), *_coordinate_criteria())
+        .order_by(models.Record.epoch_ms)
+        .execution_options(yield_per=chunk_size)
+    ).partitions():
+        yield rows[-position % every :: every]
+        position += len(rows)
+
+
+@index.requires_records
+@index.inject_session(read_only=True)
+def count_locations_by_range(
+    session: Session,
+    start: datetime.datetime,
+    end: datetime.datetime | datetime.timedelta,
+) -> int:
+    """Count the locations in a date range."""
+    if isinstance(end, datetime.timedelta):
+        end = start + end
+    start, end = sorted((start, end))
+    return session.execute(
+        select(func.count()).filter(
+            *_time_criteria(start, end), *_coordinate_criteria()
+        )
+    ).scalar_one()
+
+
+@functools.lru_cache(maxsize=64)
+def simplified_location_arrays_by_range(
+    start: datetime.datetime,
+    end: datetime.datetime,
+    zoom: int,
+    pixels: float = 1.0,
+) -> arrays.LocationArrays:
+    """Get the locations for a date range, simplified for display at a zoom level."""
+    return simplify.simplify(location_arrays_by_range(start, end), zoom, pixels)
+
+
+def _location_arrays_statement(*criteria) -> Select:
+    """Get the statement selecting the location arrays, in timestamp order."""
+    return (
+        select(
+            models.Record.id,
+            models.Record.epoch_ms,
+            models.Record.latitude_e7,
+            models.Record.longitude_e7,
+            func.min(
+                func.coalesce(models.Record.accuracy, arrays.MISSING_ACCURACY),
+                np.iinfo(arrays.DTYPE["accuracy"]).max,
+            ),
+            models.Record.altitude,
+        )
+        .filter(
+            and_(*_coordinate_criteria(), *criteria),
+        )
+        .order_by(models.Record.epoch_ms)
+    )
+
+
+def _location_arrays(session: Session, statement: Select) -> arrays.LocationArrays:
+    """Fill the location arrays straight from the SQLite cursor."""
+    cursor = session.connection().connection.cursor()
+    try:
+        cursor.execute(
+            str(
+                statement.compile(
+                    dialect=session.get_bind().dialect,
+                    compile_kwargs={"literal_binds": True},
+                )
+            )
+        )
+        return arrays.LocationArrays.from_rows(cast(Iterable[tuple], cursor))
+    finally:
+        cursor.close()
+
+
+def _time_criteria(
+    start: datetime.date | None, end: datetime.date | None
+) -> tuple[ColumnElement[bool], ...]:
+    """Get the criteria for the locations between two timestamps."""
+    criteria = []
+    if start is not None:
+        criteria.append(models.Record.epoch_ms >= utils.epoch_ms(start))
+    if end is not None:
+        criteria.append(models.Record.epoch_ms < utils.epoch_ms(end))
+    return tuple(criteria)
+
+
+def _coordinate_criteria() -> tuple[ColumnElement[bool], ...]:
+    """Get the criteria for the records that have coordinates."""
+    return (models.Record.latitude_e7 != None, models.Record.longitude_e7 != None)
+
+
+@index.requires_records
+@index.inject_session(read_only=True)
+def location_arrays_by_date(
+    session: Session, date: datetime.date
+) -> arrays.LocationArrays:
+    """Get the locations for a date as contiguous arrays."""
+    return _location_arrays(
+        session,
+        _location_arrays_statement(
+            *_time_criteria(date, date + datetime.timedelta(days=1))
+        ),
+    )
+
+
+@index.requires_records
+@index.inject_session(read_only=True)
+def location_arrays_by_range(
+    session: Session,
+    start: datetime.datetime,
+    end: datetime.datetime | datetime.timedelta,
+) -> arrays.LocationArrays:
+    """Get the locations for a date range as contiguous arrays."""
+    if isinstance(end, datetime.timedelta):
+        end = start + end
+    start, end = sorted((start, end))
+    return _location_arrays(
+        session, _location_arrays_statement(*_time_criteria(start, end))
+    )
+
+
+@index.requires_records
+@index.inject_session(read_only=True)
+def records_in_bbox(
+    session: Session,
+    bbox: arrays.BoundingBox,
+    start: datetime.datetime | None = None,
+    end: datetime.datetime | None = None,
+) -> arrays.LocationArrays:
+    """Get the locations within a bounding box, optionally between two timestamps.
+
+    Candidates are found with the R*Tree, so the cost grows with the number of
+    locations returned rather than with the size of the records. The coordinates
+    are then checked exactly, as the R*Tree only stores 32-bit floats.
+    """
+    west, south, east, north = bbox
+    rtree, record = models.record_rtree, models.Record
+    longitudes = [(west, east)] if west <= east else [(west, 180), (-180, east)]
+    spatial = sqlalchemy.inspect(session.connection()).has_table(rtree.name)
+    result: list[arrays.LocationArrays] = []
+    for west, east in longitudes:
+        statement = _location_arrays_statement(
+            record.latitude_e7.between(round(south * 1e7), round(north * 1e7)),
+            record.longitude_e7.between(round(west * 1e7), round(east * 1e7)),
+            *_time_criteria(start, end),
+        )
+        if spatial:
+            statement = statement.join(rtree, rtree.c.id == record.id).filter(
+                rtree.c.max_latitude >= south,
+                rtree.c.min_latitude <= north,
+                rtree.c.max_longitude >= west,
+                rtree.c.min_longitude <= east,
+            )
+        result.append(_location_arrays(session, statement))
+    if len(result) == 1:
+        return result[0]
+    return arrays.LocationArrays.concatenate(*result)
+
+
+@functools.lru_cache(maxsize=256)
+def simplified_location_arrays_by_date(
+    date: datetime.date, zoom: int, pixels: float = 1.0
+) -> arrays.LocationArrays:
+    """Get the locations for a date, simplified for display at a zoom level."""
+    return simplify.simplify(location_arrays_by_date(date), zoom, pixels)
+
+
+@index.requires_records
+@index.inject_session(read_only=True)
+def record_by_id(session: Session, id: int) -> records.Location | None:
+    """Get the full record for a location, if it has coordinates."""
+    json_data = session.scalar(
+        select(models.Record.json).where(
+            models.Record.id == id, *_coordinate_criteria()
+        )
+    )
+    if json_data is None:
+        return None
+    return validate_json_with_id(records.Location)(json_data=json_data, id=id)
+
+
+@index.requires_records
+@index.inject_session(read_only=True)
 def records_by_range(
     session: Session,
     start: datetime.datetime,
@@ -64,13 +306,8 @@ def records_by_range(
     try:
         db_result = (
             session.query(models.Record)
-            .filter(
-                and_(
-                    models.Record.timestamp >= start,
-                    models.Record.timestamp < end,
-                ),
-            )
-            .order_by(models.Record.timestamp)
+            .filter(*_time_criteria(start, end), *_coordinate_criteria())
+            .order_by(models.Record.epoch_ms)
             .with_entities(models.Record.id, models.Record.json)
             .all()
         )
@@ -85,38 +322,130 @@ def records_by_range(
         return records.Records(locations=())
 
 
-@index.requires_semantic_location_history
-@index.inject_session()
-def semantic_location_history_by_date(
-    session: Session, date: datetime.date
+def _timeline_history(
+    rows: Iterator[tuple[int, str]]
 ) -> semantic_location_history.SemanticLocationHistory:
-    """Get the semantic location history for a date."""
-    table = models.semantic_location_histories[(date.year, date.month)]
-    next_date = date + datetime.timedelta(days=1)
-    db_result = (
-        session.query(table)
-        .filter(
-            and_(
-                table.end_timestamp >= date,
-                table.start_timestamp < next_date,
-            ),
-        )
-        .order_by(table.start_timestamp)
-        .with_entities(table.id, table.json)
-        .all()
-    )
+    """Validate the ids and JSON of timeline objects into a history."""
     return semantic_location_history.SemanticLocationHistory(
         timelineObjects=tuple(
             validate_json_with_id(semantic_location_history.TimelineObject)(
                 json[1], json[0]
             )
-            for json in db_result
+            for json in rows
+        )
+    )
+
+
+def _timeline_objects(
+    session: Session, start: datetime.datetime, end: datetime.datetime
+) -> semantic_location_history.SemanticLocationHistory:
+    """Get the timeline objects overlapping an interval.
+
+    The R*Tree over the intervals gives the candidates when available. Otherwise
+    the months searched start one before `start`, to include the objects that
+    started in the previous month's file.
+    """
+    timeline, rtree = models.TimelineObject, models.timeline_rtree
+    statement = (
+        select(timeline.id, timeline.json)
+        .filter(timeline.end_timestamp >= start, timeline.start_timestamp < end)
+        .order_by(timeline.start_timestamp)
+    )
+    if sqlalchemy.inspect(session.connection()).has_table(rtree.name):
+        statement = statement.join(rtree, rtree.c.id == timeline.id).filter(
+            rtree.c.max_epoch >= utils.epoch_ms(start) // 1000,
+            rtree.c.min_epoch <= -(-utils.epoch_ms(end) // 1000),
+        )
+    else:
+        previous = start.replace(day=1) - datetime.timedelta(days=1)
+        statement = statement.filter(
+            timeline.source_month.in_(
+                [utils.month_key(*month) for month in utils.months(previous, end)]
+            )
+        )
+    return _timeline_history(session.execute(statement))
+
+
+@functools.lru_cache(maxsize=12)
+@index.inject_session(read_only=True)
+def _month_intervals(
+    session: Session, fingerprint: str, month: tuple[int, int]
+) -> intervals.IntervalTree[tuple[int, int, str]]:
+    """Get an interval tree over the timeline objects of a month.
+
+    The trees of the most recently used months are kept, keyed by the fingerprint
+    of the month's file so that re-indexing a changed file invalidates them.
+    """
+    timeline = models.TimelineObject
+    return intervals.IntervalTree(
+        (start, end, (start, id, json))
+        for id, json, start, end in (
+            (
+                id,
+                json,
+                utils.epoch_ms(start_timestamp),
+                utils.epoch_ms(end_timestamp),
+            )
+            for id, json, start_timestamp, end_timestamp in session.execute(
+                select(
+                    timeline.id,
+                    timeline.json,
+                    timeline.start_timestamp,
+                    timeline.end_timestamp,
+                ).filter(timeline.source_month == utils.month_key(*month))
+            )
+        )
+    )
+
+
+def _hot_months(
+    timestamp: datetime.datetime,
+) -> Iterator[intervals.IntervalTree[tuple[int, int, str]]]:
+    """Get the interval trees of the month of a timestamp and the month before."""
+    previous = timestamp.replace(day=1) - datetime.timedelta(days=1)
+    for month in ((previous.year, previous.month), (timestamp.year, timestamp.month)):
+        if month in models.semantic_location_histories:
+            yield _month_intervals(
+                sources.fingerprint(paths.semantic_location_history(*month)), month
+            )
+
+
+@index.requires_semantic_location_history
+def semantic_location_history_by_date(
+    date: datetime.date,
+) -> semantic_location_history.SemanticLocationHistory:
+    """Get the semantic location history for a date."""
+    start = datetime.datetime.combine(date, datetime.time())
+    start_ms = utils.epoch_ms(start)
+    end_ms = utils.epoch_ms(start + datetime.timedelta(days=1))
+    return _timeline_history(
+        (id, json)
+        for _, id, json in sorted(
+            value
+            for tree in _hot_months(start)
+            for value in tree.overlapping(start_ms, end_ms)
         )
     )
 
 
 @index.requires_semantic_location_history
-@index.inject_session()
+def semantic_location_history_at(
+    timestamp: datetime.datetime,
+) -> semantic_location_history.SemanticLocationHistory:
+    """Get the timeline objects at a point in time."""
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    point = utils.epoch_ms(timestamp)
+    return _timeline_history(
+        (id, json)
+        for _, id, json in sorted(
+            value for tree in _hot_months(timestamp) for value in tree.at(point)
+        )
+    )
+
+
+@index.requires_semantic_location_history
+@index.inject_session(read_only=True)
 def semantic_location_history_by_range(
     session: Session,
     start: datetime.datetime,
@@ -126,41 +455,113 @@ def semantic_location_history_by_range(
     if isinstance(end, datetime.timedelta):
         end = start + end
     start, end = sorted((start, end))
+    return _timeline_objects(session, start, end)
 
-    tables = [
-        models.semantic_location_histories[date] for date in utils.months(start, end)
-    ]
 
-    histories = union_all(
-        *[
-            select(*[column(col.name) for col in tables[0].__table__.c]).select_from(
-                table
-            )
-            for table in tables
-        ]
-    ).subquery("histories")
-    db_result = (
-        session.query(histories)
-        .filter(column("id") == 1)
-        .order_by(column("start_timestamp"))
-        .with_entities(histories.c.id, histories.c.json)
-        .all()
-    )
-    return semantic_location_history.SemanticLocationHistory(
-        timelineObjects=tuple(
-            validate_json_with_id(semantic_location_history.TimelineObject)(
-                json[1], json[0]
-            )
-            for json in db_result
+@index.requires_records
+@index.inject_session(read_only=True)
+def daily_summaries(session: Session) -> Sequence[models.DailySummary]:
+    """Get the summary of every day with records."""
+    return session.query(models.DailySummary).order_by(models.DailySummary.date).all()
+
+
+def _version(session: Session, table_names: list[str]) -> str:
+    """Hash the fingerprints of the source files of some indexes.
+
+    The version of the package is hashed along with them.
+    """
+    fingerprints = session.execute(
+        select(models.Source.table_name, models.Source.fingerprint)
+        .where(models.Source.table_name.in_(table_names))
+        .order_by(models.Source.table_name)
+    ).all()
+    return hashlib.sha256(
+        repr((takeout_maps.__version__, fingerprints)).encode()
+    ).hexdigest()[:16]
+
+
+@functools.cache
+@index.requires_records
+@index.inject_session(read_only=True)
+def records_version(session: Session) -> str:
+    """Get a key that changes whenever the records index is rebuilt or extended."""
+    return _version(session, [models.Record.__tablename__])
+
+
+@functools.cache
+@index.requires_semantic_location_history
+@index.inject_session(read_only=True)
+def timeline_version(session: Session) -> str:
+    """Get a key that changes whenever the timeline index is rebuilt or extended."""
+    return _version(session, list(models.semantic_location_histories.values()))
+
+
+@index.requires_records
+@index.inject_session(read_only=True)
+def heatmap_version(session: Session) -> str:
+    """Get a key that changes whenever records are added to the heatmap."""
+    return f"{models.HeatmapCell.__tablename__}-{session.scalar(func.max(models.Record.id).select())}"
+
+
+@index.requires_records
+@index.inject_session(read_only=True)
+def heatmap_cells(
+    session: Session, zoom: int, x: int, y: int
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Get the global x, y and count of the heatmap cells in a tile."""
+    table = models.HeatmapCell
+    xs, ys, counts = (
+        np.array(
+            [
+                tuple(row)
+                for row in session.execute(
+                    select(table.x, table.y, table.count).where(
+                        table.zoom == zoom,
+                        table.x.between(x * tiles.GRID, (x + 1) * tiles.GRID - 1),
+                        table.y.between(y * tiles.GRID, (y + 1) * tiles.GRID - 1),
+                    )
+                )
+            ],
+            dtype=np.int64,
         )
+        .reshape(-1, 3)
+        .T
     )
+    return xs, ys, counts
 
 
-@utils.local_cache
+@functools.cache
 @index.requires_records
-@index.inject_session()
+@index.inject_session(read_only=True)
 def records_range(session) -> tuple[datetime.datetime, datetime.datetime]:
     """Get the first and last timestamp for the records."""
     return session.query(
         func.min(models.Record.timestamp), func.max(models.Record.timestamp)
     ).first()
+
+
+arecords_by_date = utils.run_in_executor(records_by_date)
+arecords_by_range = utils.run_in_executor(records_by_range)
+alocation_rows_by_date = utils.run_in_executor(location_rows_by_date)
+alocation_rows_by_range = utils.run_in_executor(location_rows_by_range)
+acount_locations_by_range = utils.run_in_executor(count_locations_by_range)
+alocation_arrays_by_date = utils.run_in_executor(location_arrays_by_date)
+alocation_arrays_by_range = utils.run_in_executor(location_arrays_by_range)
+asimplified_location_arrays_by_date = utils.run_in_executor(
+    simplified_location_arrays_by_date
+)
+asimplified_location_arrays_by_range = utils.run_in_executor(
+    simplified_location_arrays_by_range
+)
+arecords_in_bbox = utils.run_in_executor(records_in_bbox)
+arecord_by_id = utils.run_in_executor(record_by_id)
+asemantic_location_history_by_date = utils.run_in_executor(
+    semantic_location_history_by_date
+)
+asemantic_location_history_by_range = utils.run_in_executor(
+    semantic_location_history_by_range
+)
+asemantic_location_history_at = utils.run_in_executor(semantic_location_history_at)
+adaily_summaries = utils.run_in_executor(daily_summaries)
+arecords_version = utils.run_in_executor(records_version)
+atimeline_version = utils.run_in_executor(timeline_version)
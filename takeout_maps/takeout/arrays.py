@@ -0,0 +1,140 @@
+"""Array-backed views of the indexed records."""
+import dataclasses
+import datetime
+from typing import Iterable, NamedTuple, Sequence, overload
+
+import numpy as np
+
+from takeout_maps.api.takeout import records
+
+DTYPE = np.dtype(
+    [
+        ("id", np.int64),
+        ("epoch_ms", np.int64),
+        ("latitude_e7", np.int32),
+        ("longitude_e7", np.int32),
+        ("accuracy", np.int16),
+        ("altitude", np.float32),
+    ]
+)
+MISSING_ACCURACY = -1
+
+
+class BoundingBox(NamedTuple):
+    """Bounding box in degrees. If `west > east`, the box crosses the antimeridian."""
+
+    west: float
+    south: float
+    east: float
+    north: float
+
+
+@dataclasses.dataclass(frozen=True)
+class LocationArrays:
+    """Locations stored as a struct of contiguous arrays.
+
+    Missing accuracies are stored as `MISSING_ACCURACY` and missing altitudes as
+    `nan`.
+    """
+
+    id: np.ndarray
+    epoch_ms: np.ndarray
+    latitude_e7: np.ndarray
+    longitude_e7: np.ndarray
+    accuracy: np.ndarray
+    altitude: np.ndarray
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[tuple], count: int = -1) -> "LocationArrays":
+        """Fill the arrays from tuples ordered as the fields of `DTYPE`."""
+        table = np.fromiter(rows, dtype=DTYPE, count=count)
+        return cls(
+            **{
+                field.name: np.ascontiguousarray(table[field.name])
+                for field in dataclasses.fields(cls)
+            }
+        )
+
+    @classmethod
+    def concatenate(cls, *locations: "LocationArrays") -> "LocationArrays":
+        """Join locations together, keeping them in timestamp order."""
+        order = np.argsort(
+            np.concatenate([arrays.epoch_ms for arrays in locations]), kind="stable"
+        )
+        return cls(
+            **{
+                field.name: np.concatenate(
+                    [getattr(arrays, field.name) for arrays in locations]
+                )[order]
+                for field in dataclasses.fields(cls)
+            }
+        )
+
+    def __len__(self) -> int:
+        """Get the number of locations."""
+        return len(self.epoch_ms)
+
+    def take(self, indices: np.ndarray | slice) -> "LocationArrays":
+        """Get a subset of the locations."""
+        return LocationArrays(
+            **{
+                field.name: getattr(self, field.name)[indices]
+                for field in dataclasses.fields(self)
+            }
+        )
+
+    def downsample(self, limit: int) -> "LocationArrays":
+        """Keep evenly spaced locations, so that there are at most `limit`."""
+        return self.take(slice(None, None, max(1, -(-len(self) // limit))))
+
+    @property
+    def locations(self) -> "LazyLocations":
+        """Get a view of the locations that creates the models on access."""
+        return LazyLocations(self)
+
+    def to_records(self) -> records.Records:
+        """Create the pydantic models for all the locations."""
+        return records.Records(locations=tuple(self.locations))
+
+
+class LazyLocations(Sequence[records.Location]):
+    """Sequence of pydantic locations that are only created when accessed.
+
+    The locations only carry the fields held by the arrays, i.e. the id, position,
+    timestamp, accuracy and altitude. Use `takeout_maps.takeout.record_by_id` for
+    the full record.
+    """
+
+    def __init__(self, arrays: LocationArrays) -> None:
+        """Wrap the arrays of the locations."""
+        self.arrays = arrays
+
+    def __len__(self) -> int:
+        """Get the number of locations."""
+        return len(self.arrays)
+
+    @overload
+    def __getitem__(self, index: int) -> records.Location:
+        """Get the location at an index."""
+
+    @overload
+    def __getitem__(self, index: slice) -> "LazyLocations":
+        """Get the locations in a slice."""
+
+    def __getitem__(self, index):
+        """Get the location at an index, or the locations in a slice."""
+        if isinstance(index, slice):
+            return LazyLocations(self.arrays.take(index))
+        arrays = self.arrays
+        accuracy = int(arrays.accuracy[index])
+        altitude = float(arrays.altitude[index])
+        return records.Location(
+            id=int(arrays.id[index]),
+            latitudeE7=int(arrays.latitude_e7[index]),
+            longitudeE7=int(arrays.longitude_e7[index]),
+            timestamp=datetime.datetime.fromtimestamp(
+                int(arrays.epoch_ms[index]) / 1000, tz=datetime.timezone.utc
+            ),
+            accuracy=None if accuracy == MISSING_ACCURACY else accuracy,
+            altitude=None if np.isnan(altitude) else int(altitude),
+        )
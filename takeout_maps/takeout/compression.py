@@ -0,0 +1,125 @@
+"""Optional zstd compression of the JSON stored in the index.
+
+When an index is built with `takeout_maps.constants.JSON_COMPRESSION` set to
+`"zstd"`, the JSON of each row is compressed with a dictionary trained on the first
+rows of its file. Dictionaries are stored in the index, and zstd frames carry the
+id of their dictionary, so rows are decompressed when fetched whatever the setting
+is then. Compressed and uncompressed rows can so share a table.
+"""
+import functools
+import threading
+from typing import Callable
+
+import sqlalchemy
+from sqlalchemy import select, types
+
+import takeout_maps.constants
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None  # type: ignore[assignment]
+
+DICTIONARY_SIZE = 112_640
+"""The size of the trained dictionaries, in bytes."""
+TRAINING_SAMPLES = 10_000
+"""The most rows to train a dictionary on."""
+LEVEL = 3
+"""The zstd compression level."""
+
+_local = threading.local()
+
+
+class CompressedText(types.TypeDecorator):
+    """Text that may be stored compressed, and is decompressed when fetched."""
+
+    impl = types.String
+    cache_ok = True
+
+    def process_result_value(self, value, dialect):
+        """Decompress a fetched value if it was stored compressed."""
+        if isinstance(value, bytes):
+            return decompress(value)
+        return value
+
+
+def _require_zstandard():
+    if zstandard is None:
+        raise ImportError(
+            "zstandard is required for compressed indexes, install takeout-maps[zstd]."
+        )
+
+
+@functools.cache
+def _dictionary(dict_id: int) -> "zstandard.ZstdCompressionDict":
+    """Load a dictionary from the index."""
+    from takeout_maps.takeout import index, models
+
+    table = models.CompressionDictionary
+    with index.engine(read_only=True).connect() as connection:
+        data = connection.scalar(select(table.data).where(table.dict_id == dict_id))
+    if data is None:
+        raise LookupError(f"The compression dictionary {dict_id} is not in the index.")
+    return zstandard.ZstdCompressionDict(data)
+
+
+def decompress(data: bytes) -> str:
+    """Decompress the JSON of a row."""
+    _require_zstandard()
+    dict_id = zstandard.get_frame_parameters(data).dict_id
+    # Decompressors are not thread-safe, so each thread has its own.
+    decompressors = _local.__dict__.setdefault("decompressors", {})
+    if dict_id not in decompressors:
+        decompressors[dict_id] = zstandard.ZstdDecompressor(
+            dict_data=_dictionary(dict_id) if dict_id else None
+        )
+    return decompressors[dict_id].decompress(data).decode()
+
+
+def encoder(
+    connection: sqlalchemy.Connection, table_name: str, samples: list[str]
+) -> Callable[[str], str | bytes]:
+    """Get the function that encodes the JSON of the rows of a table for storage.
+
+    With compression, the dictionary already stored for the table is reused, so
+    that rows appended later share it. Otherwise one is trained on `samples` and
+    stored using `connection`, falling back to no dictionary if there are too few
+    samples to train one.
+    """
+    if not takeout_maps.constants.JSON_COMPRESSION:
+        return str
+    if takeout_maps.constants.JSON_COMPRESSION != "zstd":
+        raise ValueError(
+            f"Unknown JSON compression {takeout_maps.constants.JSON_COMPRESSION!r}."
+        )
+    _require_zstandard()
+    from takeout_maps.takeout import models
+
+    table = models.CompressionDictionary
+    table.__table__.create(bind=connection, checkfirst=True)
+    data = connection.scalar(
+        select(table.data)
+        .where(table.table_name == table_name)
+        .order_by(table.created_on.desc())
+        .limit(1)
+    )
+    if data is not None:
+        dictionary = zstandard.ZstdCompressionDict(data)
+    else:
+        try:
+            dictionary = zstandard.train_dictionary(
+                DICTIONARY_SIZE,
+                [sample.encode() for sample in samples[:TRAINING_SAMPLES]],
+            )
+        except zstandard.ZstdError:
+            dictionary = None
+        else:
+            connection.execute(
+                sqlalchemy.insert(table).values(
+                    dict_id=dictionary.dict_id(),
+                    table_name=table_name,
+                    data=dictionary.as_bytes(),
+                )
+            )
+    compressor = zstandard.ZstdCompressor(level=LEVEL, dict_data=dictionary)
+    return lambda text: compressor.compress(text.encode())
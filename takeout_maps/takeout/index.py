@@ -1,34 +1,103 @@
 """Module for indexing takeout."""
+import concurrent.futures
+import contextlib
 import datetime
 import functools
-import io
-import json
-from decimal import Decimal
+import inspect
+import multiprocessing
+import threading
+import typing
 from typing import Callable, Concatenate, ParamSpec, TypeVar
 
-import ijson
+import numpy as np
 import sqlalchemy
 import tqdm
-from sqlalchemy import create_engine
+from loguru import logger
+from sqlalchemy import and_, create_engine, delete, func, insert, select
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import Session
+from sqlalchemy.pool import QueuePool
 
 import takeout_maps.constants
-from takeout_maps.takeout import models, paths
+from takeout_maps import exceptions
+from takeout_maps.takeout import (
+    compression,
+    models,
+    parsing,
+    paths,
+    sources,
+    tiles,
+    utils,
+)
 
 P = ParamSpec("P")
 T = TypeVar("T")
 
+progress: dict[str, tuple[int, int]] = {}
+"""The bytes indexed and total bytes of each table that has been built."""
 
-def inject_session(**engine_kwargs):
-    """Decorate a function that requires the indexes."""
-    engine = functools.cache(create_engine)(
-        takeout_maps.constants.SQLALCHEMY_URL, **engine_kwargs
+
+@functools.cache
+def engine(read_only: bool = False) -> sqlalchemy.Engine:
+    """Get the process-wide engine for the index.
+
+    Engines are pooled, so requests reuse connections (and the statements cached
+    on them). The read-only engine opens SQLite with `mode=ro`, so queries can
+    never take the write lock from an index build.
+    """
+    url = make_url(takeout_maps.constants.SQLALCHEMY_URL)
+    if read_only:
+        url = url.set(
+            database=f"file:{url.database}", query=dict(mode="ro", uri="true")
+        )
+    return create_engine(
+        url,
+        poolclass=QueuePool,
+        pool_size=takeout_maps.constants.POOL_SIZE,
+        max_overflow=takeout_maps.constants.POOL_MAX_OVERFLOW,
+        pool_pre_ping=True,
+        connect_args=dict(
+            check_same_thread=False,
+            cached_statements=takeout_maps.constants.CACHED_STATEMENTS,
+        ),
     )
-    models.Completed.__table__.create(bind=engine, checkfirst=True)
+
+
+def pool_statistics() -> dict[str, dict[str, int]]:
+    """Get the state of the connection pools, for monitoring."""
+    return {
+        ("read_only" if read_only else "read_write"): dict(
+            size=pool.size(),
+            checked_in=pool.checkedin(),
+            checked_out=pool.checkedout(),
+            overflow=pool.overflow(),
+        )
+        for read_only in (False, True)
+        for pool in (typing.cast(QueuePool, engine(read_only).pool),)
+    }
+
+
+def inject_session(read_only: bool = False):
+    """Decorate a function that requires the indexes.
+
+    Queries that only read from the index should set `read_only`.
+    """
+    models.Completed.__table__.create(bind=engine(), checkfirst=True)
+    models.Checkpoint.__table__.create(bind=engine(), checkfirst=True)
 
     def outer(fn: Callable[Concatenate[Session, P], T]) -> Callable[P, T]:
+        if inspect.isgeneratorfunction(fn):
+
+            def generator_wrapper(*args: P.args, **kwargs: P.kwargs):
+                # Keep the session open until the generator is exhausted.
+                with Session(engine(read_only)) as session:
+                    yield from fn(session, *args, **kwargs)
+
+            return generator_wrapper
+
         def wrapper(*args: P.args, **kwargs: P.kwargs) -> T:
-            with Session(engine) as session:
+            with Session(engine(read_only)) as session:
                 return fn(session, *args, **kwargs)
 
         return wrapper
@@ -37,14 +106,15 @@ def inject_session(**engine_kwargs):
 
 
 @inject_session()
-def completed(session, table: type[models.Base]) -> bool:
-    """Check if an index has been completed."""
+def completed(session, table: type[models.Base] | str) -> bool:
+    """Check if an index, given by its table or tracked name, has been completed."""
+    name = table if isinstance(table, str) else table.__tablename__
     return (
         sqlalchemy.inspect(session.bind).has_table(models.Completed.__tablename__)
         and session.query(
             session.query(models.Completed)
             .filter(
-                models.Completed.table_name == table.__tablename__,
+                models.Completed.table_name == name,
                 models.Completed.completed_on != None,
             )
             .exists()
@@ -52,6 +122,29 @@ def completed(session, table: type[models.Base]) -> bool:
     )
 
 
+@contextlib.contextmanager
+def _build_pragmas(connection: sqlalchemy.Connection, cache_size: int = -262_144):
+    """Tune the SQLite connection for bulk writes for the duration of a build.
+
+    WAL is persistent for the database file, whereas `synchronous` and `cache_size`
+    are restored once the build has finished.
+    """
+    synchronous = connection.exec_driver_sql("PRAGMA synchronous").scalar_one()
+    previous_cache_size = connection.exec_driver_sql("PRAGMA cache_size").scalar_one()
+    connection.exec_driver_sql("PRAGMA journal_mode=WAL")
+    connection.exec_driver_sql("PRAGMA synchronous=OFF")
+    connection.exec_driver_sql(f"PRAGMA cache_size={int(cache_size)}")
+    try:
+        yield connection
+    except BaseException:
+        # The pragmas cannot be restored inside the transaction of a failed chunk.
+        connection.rollback()
+        raise
+    finally:
+        connection.exec_driver_sql(f"PRAGMA synchronous={int(synchronous)}")
+        connection.exec_driver_sql(f"PRAGMA cache_size={int(previous_cache_size)}")
+
+
 @inject_session()
 def _create_index(
     session: Session,
@@ -59,58 +152,745 @@ def _create_index(
     table: type[models.Base],
     json_array: str,
     fields: Callable[[dict], dict],
-    refresh_every: int = 1000,
+    chunk_size: int = 50_000,
+    after_chunk: Callable[[sqlalchemy.Connection, int, int], None] | None = None,
+    after: datetime.datetime | None = None,
 ):
-    """Create an index for a file."""
-    table.__table__.create(bind=session.bind, checkfirst=True)
+    """Create an index for a file.
 
-    def decimal_encoder(o):
-        if isinstance(o, Decimal):
-            return float(o)
-        raise TypeError(repr(o) + " is not JSON serializable")
+    Rows are built in chunks of `chunk_size` and written with a single
+    `executemany` per chunk, each chunk being its own transaction. The byte offset
+    reached by each chunk is checkpointed in the same transaction, so an
+    interrupted build resumes from where it stopped rather than re-parsing the
+    file from the start.
 
-    if not completed(table):
-        i = session.query(table).count()
-        try:
-            with open(src_file, "r") as fp:
-                fp.seek(0, io.SEEK_END)
-                end = fp.tell()
-                fp.seek(0)
-                progress = tqdm.tqdm(total=end, desc=f"Indexing {table.__name__}...")
-                parser = ijson.items(fp, json_array + ".item")
-                for j, o in enumerate(parser):
-                    if j % refresh_every == 0:
-                        progress.update(fp.tell() - progress.n)
-                    if j < i:
-                        continue
-                    session.add(
-                        table(
-                            id=j,
-                            json=json.dumps(o, default=decimal_encoder),
-                            **fields(o),
+    If given, `after_chunk` is called with the connection and the first and last
+    ids of each chunk before it is committed, to maintain derived tables.
+
+    If `after` is given, only the items with a later timestamp are indexed, to
+    append the new items of a file that has been indexed before.
+    """
+    table.__table__.create(bind=engine(), checkfirst=True)
+
+    if completed(table):
+        size = sources.getsize(src_file)
+        progress[table.__tablename__] = (size, size)
+        return
+    checkpoint = session.get(models.Checkpoint, table.__tablename__)
+    offset, last_id = (
+        (checkpoint.byte_offset, checkpoint.last_id) if checkpoint else (0, -1)
+    )
+    session.query(table).filter(table.__table__.c.id > last_id).delete()
+    if after_chunk is not None:
+        after_chunk(session.connection(), last_id + 1, -1)
+    session.commit()
+    session.close()
+    after_ms = None if after is None else utils.epoch_ms(after)
+    encode: Callable[[str], str | bytes] | None = None
+    statement = insert(table)
+    save_checkpoint = sqlite.insert(models.Checkpoint)
+    save_checkpoint = save_checkpoint.on_conflict_do_update(
+        index_elements=[models.Checkpoint.table_name],
+        set_=dict(
+            byte_offset=save_checkpoint.excluded.byte_offset,
+            last_id=save_checkpoint.excluded.last_id,
+        ),
+    )
+    with engine().connect() as connection, _build_pragmas(connection):
+        with sources.open(src_file) as fp:
+            end = sources.getsize(src_file)
+            progress_bar = tqdm.tqdm(
+                total=end, initial=offset, desc=f"Indexing {table.__name__}..."
+            )
+            progress[table.__tablename__] = (offset, end)
+            written = 0
+            for batch, offset in parsing.iter_batches(
+                fp, json_array, chunk_size, offset
+            ):
+                rows: list[dict] = []
+                for o in batch:
+                    row = fields(o)
+                    if after_ms is None or row["epoch_ms"] > after_ms:
+                        rows.append(
+                            dict(
+                                id=last_id + 1 + len(rows),
+                                json=parsing.dumps(o),
+                                **row,
+                            )
+                        )
+                if rows:
+                    if encode is None:
+                        encode = compression.encoder(
+                            connection,
+                            table.__tablename__,
+                            [row["json"] for row in rows],
                         )
+                    for row in rows:
+                        row["json"] = encode(row["json"])
+                    connection.execute(statement, rows)
+                    if after_chunk is not None:
+                        after_chunk(connection, last_id + 1, last_id + len(rows))
+                last_id += len(rows)
+                connection.execute(
+                    save_checkpoint.values(
+                        table_name=table.__tablename__,
+                        byte_offset=offset,
+                        last_id=last_id,
                     )
+                )
+                connection.commit()
+                written += len(rows)
+                progress_bar.update(offset - progress_bar.n)
+                progress[table.__tablename__] = (offset, end)
+                elapsed = progress_bar.format_dict["elapsed"]
+                if elapsed:
+                    progress_bar.set_postfix_str(f"{written / elapsed:,.0f} rows/s")
+            progress_bar.update(end - progress_bar.n)
+            progress_bar.close()
+        connection.execute(
+            delete(models.Checkpoint).where(
+                models.Checkpoint.table_name == table.__tablename__
+            )
+        )
+        connection.execute(
+            insert(models.Completed).values(table_name=table.__tablename__)
+        )
+        connection.commit()
+        progress[table.__tablename__] = (end, end)
 
-                    if j % refresh_every == 0:
-                        session.commit()
-            session.add(models.Completed(table_name=table.__tablename__))
-            session.commit()
-        finally:
-            session.commit()
 
+def _epoch(
+    timestamp: sqlalchemy.ColumnExpressionArgument[datetime.datetime],
+) -> sqlalchemy.ColumnElement[int]:
+    """Get the seconds since the epoch of a timestamp column, as stored in UTC."""
+    return sqlalchemy.cast(func.strftime("%s", timestamp), sqlalchemy.Integer)
 
-def requires_records(fn: Callable[P, T]) -> Callable[P, T]:
-    """Decorate a function tha requires the records."""
+
+def _parse_timeline_objects(src_file: str) -> list[dict]:
+    """Parse the timeline objects of a semantic location history file."""
+    return [
+        dict(json=raw, **_timeline_object_fields(o))
+        for o, raw in parsing.items(src_file, "timelineObjects")
+    ]
+
+
+@inject_session()
+def _create_timeline_index(session: Session, workers: int = 1):
+    """Index the timeline objects of each month of the semantic location history.
+
+    With more than one worker, the month files are parsed in a pool of processes.
+    As SQLite only allows a single writer, the rows are all written from this
+    process, each month in a single transaction that first deletes the rows left by
+    any earlier build of that month. A month is so either fully indexed or not at
+    all. Months are indexed again when the fingerprint of their file changes.
+    """
+    models.TimelineObject.__table__.create(bind=engine(), checkfirst=True)
+    models.Source.__table__.create(bind=engine(), checkfirst=True)
+    save_source = _save_source()
+    pending = {}
+    for date, name in models.semantic_location_histories.items():
+        src_file = paths.semantic_location_history(*date)
+        size = sources.getsize(src_file)
+        source = session.get(models.Source, name)
+        if (
+            completed(name)
+            and source is not None
+            and source.fingerprint == sources.fingerprint(src_file)
+        ):
+            progress[name] = (size, size)
+        else:
+            progress[name] = (0, size)
+            pending[date] = name
+    session.close()
+    if not pending:
+        return
+    progress_bar = tqdm.tqdm(
+        total=sum(progress[name][1] for name in pending.values()),
+        desc=f"Indexing {len(pending)} months of semantic location history...",
+    )
+    with contextlib.ExitStack() as stack:
+        connection = stack.enter_context(engine().connect())
+        stack.enter_context(_build_pragmas(connection))
+        if workers > 1:
+            executor = stack.enter_context(
+                concurrent.futures.ProcessPoolExecutor(
+                    max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            )
+            futures = {
+                executor.submit(
+                    _parse_timeline_objects, paths.semantic_location_history(*date)
+                ): date
+                for date in pending
+            }
+            parsed = (
+                (futures[future], future.result())
+                for future in concurrent.futures.as_completed(futures)
+            )
+        else:
+            parsed = (
+                (date, _parse_timeline_objects(paths.semantic_location_history(*date)))
+                for date in pending
+            )
+        overlap_index = _create_rtree(connection, models.timeline_rtree)
+        encode = None
+        for date, rows in parsed:
+            source_month = utils.month_key(*date)
+            in_month = models.TimelineObject.source_month == source_month
+            if overlap_index:
+                connection.execute(
+                    delete(models.timeline_rtree).where(
+                        models.timeline_rtree.c.id.in_(
+                            select(models.TimelineObject.id).where(in_month)
+                        )
+                    )
+                )
+            connection.execute(delete(models.TimelineObject).where(in_month))
+            if rows:
+                if encode is None:
+                    encode = compression.encoder(
+                        connection,
+                        models.TimelineObject.__tablename__,
+                        [row["json"] for row in rows],
+                    )
+                connection.execute(
+                    insert(models.TimelineObject),
+                    [
+                        dict(row, json=encode(row["json"]), source_month=source_month)
+                        for row in rows
+                    ],
+                )
+            if overlap_index:
+                connection.execute(
+                    insert(models.timeline_rtree).from_select(
+                        [column.name for column in models.timeline_rtree.c],
+                        select(
+                            models.TimelineObject.id,
+                            _epoch(models.TimelineObject.start_timestamp),
+                            _epoch(models.TimelineObject.end_timestamp),
+                        ).where(in_month),
+                    )
+                )
+            connection.execute(
+                delete(models.Completed).where(
+                    models.Completed.table_name == pending[date]
+                )
+            )
+            connection.execute(
+                insert(models.Completed).values(table_name=pending[date])
+            )
+            connection.execute(
+                save_source.values(
+                    table_name=pending[date],
+                    fingerprint=sources.fingerprint(
+                        paths.semantic_location_history(*date)
+                    ),
+                )
+            )
+            connection.commit()
+            _, size = progress[pending[date]]
+            progress[pending[date]] = (size, size)
+            progress_bar.update(size)
+    progress_bar.close()
+
+
+def _optional_int(value) -> int | None:
+    """Convert a JSON number to an int, keeping missing values as `None`."""
+    return None if value is None else int(value)
+
+
+def _activity_type(data: dict) -> str | None:
+    """Get the most likely activity from the first activity record of a location."""
+    first: dict = next(iter(data.get("activity") or ()), {})
+    activities = first.get("activity")
+    if not activities:
+        return None
+    return max(activities, key=lambda activity: activity.get("confidence", 0)).get(
+        "type"
+    )
+
+
+def _record_fields(data: dict) -> dict:
+    """Get the typed columns for a location in the records.
+
+    The timestamp is stored in UTC, like `epoch_ms`.
+    """
+    timestamp = datetime.datetime.fromisoformat(data["timestamp"])
+    return dict(
+        timestamp=utils.utc(timestamp),
+        epoch_ms=utils.epoch_ms(timestamp),
+        latitude_e7=_optional_int(data.get("latitudeE7")),
+        longitude_e7=_optional_int(data.get("longitudeE7")),
+        accuracy=_optional_int(data.get("accuracy")),
+        altitude=_optional_int(data.get("altitude")),
+        velocity=_optional_int(data.get("velocity")),
+        heading=_optional_int(data.get("heading")),
+        device_tag=_optional_int(data.get("deviceTag")),
+        source=data.get("source"),
+        activity_type=_activity_type(data),
+    )
+
+
+def _haversine(
+    latitude_e7: np.ndarray, longitude_e7: np.ndarray, radius: float = 6_371_008.8
+) -> np.ndarray:
+    """Get the distances in metres between consecutive E7 coordinates."""
+    latitude, longitude = np.radians(latitude_e7 / 1e7), np.radians(longitude_e7 / 1e7)
+    a = (
+        np.sin(np.diff(latitude) / 2) ** 2
+        + np.cos(latitude[:-1])
+        * np.cos(latitude[1:])
+        * np.sin(np.diff(longitude) / 2) ** 2
+    )
+    return 2 * radius * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+@inject_session()
+def _create_daily_summary(session: Session, chunk_size: int = 500_000):
+    """Summarise the records for each day.
+
+    Counts, bounds and first/last timestamps are aggregated in SQL. The distance
+    travelled is accumulated over a single ordered scan of the coordinates, keeping
+    the previous point across chunks.
+    """
+    table = models.DailySummary
+    table.__table__.create(bind=engine(), checkfirst=True)
+    if completed(table):
+        progress[table.__tablename__] = (1, 1)
+        return
+    progress[table.__tablename__] = (0, 1)
+    record = models.Record
+    located = and_(record.latitude_e7 != None, record.longitude_e7 != None)
+    day = func.date(record.timestamp)
+    summaries = {
+        datetime.date.fromisoformat(row[0]): dict(
+            date=datetime.date.fromisoformat(row[0]),
+            point_count=row[1],
+            min_latitude_e7=row[2],
+            max_latitude_e7=row[3],
+            min_longitude_e7=row[4],
+            max_longitude_e7=row[5],
+            first_timestamp=row[6],
+            last_timestamp=row[7],
+            distance_m=0.0,
+            dominant_activity=None,
+        )
+        for row in session.execute(
+            select(
+                day,
+                func.count(),
+                func.min(record.latitude_e7),
+                func.max(record.latitude_e7),
+                func.min(record.longitude_e7),
+                func.max(record.longitude_e7),
+                func.min(record.timestamp),
+                func.max(record.timestamp),
+            )
+            .filter(located)
+            .group_by(day)
+        )
+    }
+    activities = (
+        select(
+            day.label("day"),
+            record.activity_type.label("activity_type"),
+            func.count().label("n"),
+        )
+        .filter(located, record.activity_type != None)
+        .group_by(day, record.activity_type)
+        .subquery()
+    )
+    # SQLite takes the bare column from the row holding the max.
+    for date, activity_type, _ in session.execute(
+        select(
+            activities.c.day, activities.c.activity_type, func.max(activities.c.n)
+        ).group_by(activities.c.day)
+    ):
+        summaries[datetime.date.fromisoformat(date)][
+            "dominant_activity"
+        ] = activity_type
+
+    distances: dict[int, float] = {}
+    previous = None
+    for rows in session.execute(
+        select(record.epoch_ms, record.latitude_e7, record.longitude_e7)
+        .filter(located)
+        .order_by(record.epoch_ms)
+        .execution_options(yield_per=chunk_size)
+    ).partitions():
+        chunk = np.array(rows, dtype=np.int64)
+        if previous is not None:
+            chunk = np.vstack((previous, chunk))
+        days = chunk[:, 0] // 86_400_000
+        same_day = days[1:] == days[:-1]
+        totals = np.bincount(
+            days[1:][same_day] - days[0],
+            weights=_haversine(chunk[:, 1], chunk[:, 2])[same_day],
+        )
+        for offset in np.flatnonzero(totals):
+            key = int(days[0] + offset)
+            distances[key] = distances.get(key, 0.0) + float(totals[offset])
+        previous = chunk[-1:]
+    epoch = datetime.date(1970, 1, 1)
+    for key, distance in distances.items():
+        summaries[epoch + datetime.timedelta(days=key)]["distance_m"] = distance
+
+    session.execute(delete(table))
+    if summaries:
+        session.execute(insert(table), list(summaries.values()))
+    session.add(models.Completed(table_name=table.__tablename__))
+    session.commit()
+    progress[table.__tablename__] = (1, 1)
+
+
+def _create_rtree(connection: sqlalchemy.Connection, rtree: sqlalchemy.Table) -> bool:
+    """Create an R*Tree virtual table, if SQLite supports it."""
+    try:
+        connection.exec_driver_sql(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS "
+            f'"{rtree.name}" USING rtree('
+            + ", ".join(column.name for column in rtree.c)
+            + ")"
+        )
+    except sqlalchemy.exc.OperationalError:
+        logger.warning(f"SQLite was built without R*Tree, skipping {rtree.name}.")
+        return False
+    return True
+
+
+def _index_locations(connection: sqlalchemy.Connection, first: int, last: int):
+    """Add the records with ids from `first` to `last` to the spatial index.
+
+    A negative `last` removes any entries from `first` onwards instead, to drop
+    those left behind by an interrupted build.
+    """
+    if not _create_rtree(connection, models.record_rtree):
+        return
+    rtree, record = models.record_rtree, models.Record
+    if last < 0:
+        connection.execute(delete(rtree).where(rtree.c.id >= first))
+        return
+    latitude, longitude = record.latitude_e7 / 1e7, record.longitude_e7 / 1e7
+    connection.execute(
+        insert(rtree).from_select(
+            [column.name for column in rtree.c],
+            select(record.id, latitude, latitude, longitude, longitude).where(
+                record.id.between(first, last),
+                record.latitude_e7 != None,
+                record.longitude_e7 != None,
+            ),
+        )
+    )
+
+
+def _aggregate_heatmap(connection: sqlalchemy.Connection, first: int, last: int):
+    """Add the records with ids from `first` to `last` to the heatmap counts.
+
+    A negative `last` from the start of the records clears the counts instead, as
+    only a build without a checkpoint can leave rows behind.
+    """
+    table, record = models.HeatmapCell, models.Record
+    table.__table__.create(bind=connection, checkfirst=True)
+    if last < 0:
+        if first == 0:
+            connection.execute(delete(table))
+        return
+    coordinates = np.array(
+        connection.execute(
+            select(record.latitude_e7, record.longitude_e7).where(
+                record.id.between(first, last),
+                record.latitude_e7 != None,
+                record.longitude_e7 != None,
+            )
+        ).all(),
+        dtype=np.int64,
+    ).reshape(-1, 2)
+    if not len(coordinates):
+        return
+    statement = sqlite.insert(table)
+    connection.execute(
+        statement.on_conflict_do_update(
+            index_elements=[table.zoom, table.x, table.y],
+            set_=dict(count=table.count + statement.excluded["count"]),
+        ),
+        list(tiles.aggregate(coordinates[:, 0], coordinates[:, 1])),
+    )
+
+
+def _index_derived(connection: sqlalchemy.Connection, first: int, last: int):
+    """Maintain the tables derived from each chunk of the records."""
+    _index_locations(connection, first, last)
+    _aggregate_heatmap(connection, first, last)
+
+
+def _timeline_object_fields(data: dict) -> dict:
+    """Get the typed columns for a timeline object in a semantic location history."""
+    duration = (
+        data["activitySegment"] if "activitySegment" in data else data["placeVisit"]
+    )["duration"]
+    return dict(
+        start_timestamp=datetime.datetime.fromisoformat(duration["startTimestamp"]),
+        end_timestamp=datetime.datetime.fromisoformat(duration["endTimestamp"]),
+    )
+
+
+def _save_source() -> sqlalchemy.Insert:
+    """Get the statement to save the fingerprint of the file of an index."""
+    statement = sqlite.insert(models.Source)
+    return statement.on_conflict_do_update(
+        index_elements=[models.Source.table_name],
+        set_=dict(
+            fingerprint=statement.excluded.fingerprint,
+            high_water=statement.excluded.high_water,
+        ),
+    )
+
+
+@inject_session()
+def _track_source(
+    session: Session,
+    src_file: str,
+    table: type[models.Base],
+    derived: tuple[type[models.Base], ...] = (),
+) -> datetime.datetime | None:
+    """Check whether the file of an index has changed since it was built.
+
+    When the fingerprint of the file has changed, e.g. for a new export, the rows
+    already indexed are kept and the index (along with the tables `derived` from
+    it) is reopened to append the items after the latest indexed timestamp. This
+    returns that timestamp, if any.
+    """
+    models.Source.__table__.create(bind=engine(), checkfirst=True)
+    table.__table__.create(bind=engine(), checkfirst=True)
+    fingerprint = sources.fingerprint(src_file)
+    source = session.get(models.Source, table.__tablename__)
+    if source is not None and source.fingerprint == fingerprint:
+        return source.high_water
+    high_water, last_id = session.execute(
+        select(func.max(table.__table__.c.timestamp), func.max(table.__table__.c.id))
+    ).one()
+    session.execute(
+        delete(models.Completed).where(
+            models.Completed.table_name.in_(
+                [model.__tablename__ for model in (table, *derived)]
+            )
+        )
+    )
+    session.execute(
+        delete(models.Checkpoint).where(
+            models.Checkpoint.table_name == table.__tablename__
+        )
+    )
+    if last_id is not None:
+        session.add(
+            models.Checkpoint(
+                table_name=table.__tablename__, byte_offset=0, last_id=last_id
+            )
+        )
+        logger.info(f"{src_file} has changed, indexing the items after {high_water}.")
+    session.execute(
+        _save_source().values(
+            table_name=table.__tablename__,
+            fingerprint=fingerprint,
+            high_water=high_water,
+        )
+    )
+    session.commit()
+    return high_water
+
+
+@inject_session()
+def collect_garbage(session: Session) -> list[str]:
+    """Drop the tables, and forget the indexes, that are not of the current takeout.
+
+    These are the tables left behind by previous schema versions and files that
+    are no longer in the takeout, along with the timeline objects of months that
+    are no longer in the takeout. Returns the names of the dropped tables.
+    """
+    inspector = sqlalchemy.inspect(session.connection())
+    current = {
+        models.Record.__tablename__,
+        models.DailySummary.__tablename__,
+        *models.semantic_location_histories.values(),
+    }
+    tables = {
+        *models.Base.metadata.tables,
+        models.record_rtree.name,
+        models.timeline_rtree.name,
+    }
+    orphans: set[str] = set()
+    for model in (models.Completed, models.Checkpoint, models.Source):
+        if inspector.has_table(model.__tablename__):
+            orphans.update(session.scalars(select(model.table_name)))
+    orphans -= current
+    # Dropping an R*Tree also drops its shadow tables, whose names are longer.
+    dropped = sorted(
+        (
+            name
+            for name in inspector.get_table_names()
+            if name not in tables
+            and any(
+                name == orphan or name.startswith(f"{orphan}-") for orphan in orphans
+            )
+        ),
+        key=len,
+    )
+    connection = session.connection()
+    for name in dropped:
+        connection.exec_driver_sql(f'DROP TABLE IF EXISTS "{name}"')
+    for table in (
+        models.Completed,
+        models.Checkpoint,
+        models.Source,
+        models.CompressionDictionary,
+    ):
+        if inspector.has_table(table.__tablename__):
+            session.execute(delete(table).where(table.table_name.in_(orphans)))
+    if inspector.has_table(models.TimelineObject.__tablename__):
+        stale = models.TimelineObject.source_month.not_in(
+            [utils.month_key(*date) for date in models.semantic_location_histories]
+        )
+        if inspector.has_table(models.timeline_rtree.name):
+            session.execute(
+                delete(models.timeline_rtree).where(
+                    models.timeline_rtree.c.id.in_(
+                        select(models.TimelineObject.id).where(stale)
+                    )
+                )
+            )
+        session.execute(delete(models.TimelineObject).where(stale))
+    session.commit()
+    if dropped:
+        logger.info(f"Dropped {len(dropped)} orphaned tables.")
+    return dropped
+
+
+def _build_records():
+    """Build the index of the records and the tables derived from it.
+
+    When the records have changed since they were indexed, only the newer records
+    are added.
+    """
+    after = _track_source(
+        paths.records_path, models.Record, derived=(models.DailySummary,)
+    )
     _create_index(
         paths.records_path,
         models.Record,
         "locations",
-        fields=lambda data: dict(
-            timestamp=datetime.datetime.fromisoformat(data["timestamp"])
-        ),
+        fields=_record_fields,
+        after_chunk=_index_derived,
+        after=after,
     )
+    _create_daily_summary()
+
+
+def _build_semantic_location_history():
+    """Build the index of the timeline objects in the semantic location history.
+
+    The months are parsed by up to `takeout_maps.constants.INDEX_WORKERS` processes.
+    """
+    _create_timeline_index(
+        workers=min(
+            takeout_maps.constants.INDEX_WORKERS,
+            len(models.semantic_location_histories),
+        )
+    )
+
+
+class Indexer:
+    """Builds the indexes, either on a background thread or when first required.
+
+    Once the background thread has been started, functions requiring an index that
+    is not ready raise `exceptions.IndexNotReadyError` rather than blocking, or
+    `exceptions.IndexFailedError` if its build failed.
+    """
+
+    def __init__(self) -> None:
+        """Create an indexer without any index registered."""
+        self.jobs: dict[str, tuple[Callable[[], None], Callable[[], list[str]]]] = {}
+        self.ready: set[str] = set()
+        self.errors: dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+
+    def register(
+        self, name: str, build: Callable[[], None], tables: Callable[[], list[str]]
+    ):
+        """Register the function that builds an index, and the tables it fills."""
+        self.jobs[name] = (build, tables)
+
+    @property
+    def running(self) -> bool:
+        """Whether the background thread has been started."""
+        return self._thread is not None
+
+    def start(self):
+        """Start building all the indexes on a background thread."""
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="takeout-indexer", daemon=True
+            )
+            self._thread.start()
+
+    def _run(self):
+        try:
+            collect_garbage()
+        except Exception as e:
+            logger.exception(e)
+        for name in self.jobs:
+            try:
+                self._build(name)
+            except Exception as e:
+                logger.exception(e)
+                self.errors[name] = repr(e)
+
+    def _build(self, name: str):
+        with self._lock:
+            if name not in self.ready:
+                self.jobs[name][0]()
+                self.ready.add(name)
+
+    def ensure(self, name: str):
+        """Make sure an index is ready, building it now if there is no thread."""
+        if name in self.ready:
+            return
+        if name in self.errors:
+            raise exceptions.IndexFailedError(name, self.errors[name])
+        if self.running:
+            raise exceptions.IndexNotReadyError(name)
+        self._build(name)
+
+    def status(self) -> dict[str, dict]:
+        """Get whether each index is ready, and the progress of each of its tables."""
+        return {
+            name: dict(
+                ready=name in self.ready,
+                error=self.errors.get(name),
+                tables={table: progress.get(table) for table in tables()},
+            )
+            for name, (_, tables) in self.jobs.items()
+        }
+
+
+indexer = Indexer()
+indexer.register(
+    "records",
+    _build_records,
+    lambda: [models.Record.__tablename__, models.DailySummary.__tablename__],
+)
+indexer.register(
+    "semantic_location_history",
+    _build_semantic_location_history,
+    lambda: list(models.semantic_location_histories.values()),
+)
+
+
+def requires_records(fn: Callable[P, T]) -> Callable[P, T]:
+    """Decorate a function tha requires the records."""
 
     def wrapper(*args: P.args, **kwargs: P.kwargs) -> T:
+        indexer.ensure("records")
         return fn(*args, **kwargs)
 
     return wrapper
@@ -118,26 +898,9 @@ def requires_records(fn: Callable[P, T]) -> Callable[P, T]:
 
 def requires_semantic_location_history(fn: Callable[P, T]) -> Callable[P, T]:
     """Decorate a function tha requires the semantic location history."""
-    for date, table in models.semantic_location_histories.items():
-        _create_index(
-            paths.semantic_location_history(*date),
-            table,
-            "timelineObjects",
-            fields=lambda data: dict(
-                start_timestamp=datetime.datetime.fromisoformat(
-                    data.get("activitySegment", data.get("placeVisit"))["duration"][
-                        "startTimestamp"
-                    ]
-                ),
-                end_timestamp=datetime.datetime.fromisoformat(
-                    data.get("activitySegment", data.get("placeVisit"))["duration"][
-                        "endTimestamp"
-                    ]
-                ),
-            ),
-        )
 
     def wrapper(*args: P.args, **kwargs: P.kwargs) -> T:
+        indexer.ensure("semantic_location_history")
         return fn(*args, **kwargs)
 
     return wrapper
@@ -0,0 +1,108 @@
+"""Static interval tree for point and overlap queries on closed intervals."""
+import dataclasses
+from typing import Generic, Iterable, TypeVar
+
+T = TypeVar("T")
+
+Interval = tuple[int, int, T]
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class _Node(Generic[T]):
+    center: int
+    by_start: tuple[Interval[T], ...]
+    """The intervals containing the center, by ascending start."""
+    by_end: tuple[Interval[T], ...]
+    """The intervals containing the center, by descending end."""
+    left: "_Node[T] | None"
+    right: "_Node[T] | None"
+
+
+def _build(intervals: list[Interval[T]]) -> _Node[T] | None:
+    """Build a centered interval tree, splitting at the median endpoint."""
+    if not intervals:
+        return None
+    endpoints = sorted(
+        endpoint for start, end, _ in intervals for endpoint in (start, end)
+    )
+    center = endpoints[len(endpoints) // 2]
+    left, middle, right = [], [], []
+    for interval in intervals:
+        if interval[1] < center:
+            left.append(interval)
+        elif interval[0] > center:
+            right.append(interval)
+        else:
+            middle.append(interval)
+    return _Node(
+        center,
+        tuple(sorted(middle, key=lambda interval: interval[0])),
+        tuple(sorted(middle, key=lambda interval: interval[1], reverse=True)),
+        _build(left),
+        _build(right),
+    )
+
+
+class IntervalTree(Generic[T]):
+    """Centered interval tree over closed intervals `[start, end]` with values.
+
+    Both queries take `O(log n + k)` for `k` matches. Matches are returned in no
+    particular order.
+    """
+
+    def __init__(self, intervals: Iterable[Interval[T]]) -> None:
+        """Build the tree over `(start, end, value)` intervals."""
+        intervals = list(intervals)
+        self.size = len(intervals)
+        self._root = _build(intervals)
+
+    def __len__(self) -> int:
+        """Get the number of intervals."""
+        return self.size
+
+    def at(self, point: int) -> list[T]:
+        """Get the values of the intervals containing a point."""
+        values: list[T] = []
+        node = self._root
+        while node is not None:
+            if point < node.center:
+                for start, _, value in node.by_start:
+                    if start > point:
+                        break
+                    values.append(value)
+                node = node.left
+            elif point > node.center:
+                for _, end, value in node.by_end:
+                    if end < point:
+                        break
+                    values.append(value)
+                node = node.right
+            else:
+                values.extend(value for _, _, value in node.by_start)
+                break
+        return values
+
+    def overlapping(self, start: int, end: int) -> list[T]:
+        """Get the values of the intervals overlapping the half-open `[start, end)`."""
+        values: list[T] = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            if node is None:
+                continue
+            if end <= node.center:
+                for interval_start, _, value in node.by_start:
+                    if interval_start >= end:
+                        break
+                    values.append(value)
+                stack.append(node.left)
+            elif start > node.center:
+                for _, interval_end, value in node.by_end:
+                    if interval_end < start:
+                        break
+                    values.append(value)
+                stack.append(node.right)
+            else:
+                values.extend(value for _, _, value in node.by_start)
+                stack.extend((node.left, node.right))
+        return values
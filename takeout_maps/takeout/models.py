@@ -1,14 +1,19 @@
 """SQLALchemy models for the indexer."""
 import datetime
 from types import MappingProxyType
-from typing import Mapping
+from typing import ClassVar, Mapping
 
+from sqlalchemy import Column, Float, Index, Integer, MetaData, Table
 from sqlalchemy.ext.declarative import declared_attr
-from sqlalchemy.orm import Mapped, declarative_base, mapped_column
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 
-from takeout_maps.takeout import paths, utils
+from takeout_maps.takeout import compression, paths, utils
 
-Base = declarative_base()
+
+class Base(DeclarativeBase):
+    """Base of the models for the indexer."""
+
+    __table__: ClassVar[Table]
 
 
 class Completed(Base):
@@ -21,13 +26,65 @@ class Completed(Base):
     )
 
 
+class Checkpoint(Base):
+    """Table storing how far through its file an unfinished index has got."""
+
+    __tablename__ = "index_checkpoints"
+    table_name: Mapped[str] = mapped_column(primary_key=True)
+    byte_offset: Mapped[int] = mapped_column(nullable=False)
+    last_id: Mapped[int] = mapped_column(nullable=False)
+
+
+class Source(Base):
+    """Table storing the fingerprint of the file that each index was built from."""
+
+    __tablename__ = "index_sources"
+    table_name: Mapped[str] = mapped_column(primary_key=True)
+    fingerprint: Mapped[str] = mapped_column(nullable=False)
+    high_water: Mapped[datetime.datetime | None] = mapped_column()
+
+
+class CompressionDictionary(Base):
+    """Table storing the zstd dictionaries that the indexed JSON is compressed with."""
+
+    __tablename__ = "compression_dictionaries"
+    dict_id: Mapped[int] = mapped_column(primary_key=True, autoincrement=False)
+    table_name: Mapped[str] = mapped_column(nullable=False)
+    data: Mapped[bytes] = mapped_column(nullable=False)
+    created_on: Mapped[datetime.datetime] = mapped_column(
+        default=datetime.datetime.now, nullable=False
+    )
+
+
+class FitbitIntraday(Base):
+    """Table caching the intraday datasets fetched from Fitbit."""
+
+    __tablename__ = "fitbit_intraday"
+    user_id: Mapped[str] = mapped_column(primary_key=True)
+    resource: Mapped[str] = mapped_column(primary_key=True)
+    date: Mapped[datetime.date] = mapped_column(primary_key=True)
+    detail_level: Mapped[str] = mapped_column(primary_key=True)
+    fetched_on: Mapped[datetime.datetime] = mapped_column(nullable=False)
+    json: Mapped[str] = mapped_column(nullable=False)
+
+
 class Record(Base):
     """Table for the Records.json file."""
 
-    __tablename__ = utils.table_name(paths.records_path)
+    __tablename__ = utils.table_name(paths.records_path, version=6)
     id: Mapped[int] = mapped_column(primary_key=True)
     timestamp: Mapped[datetime.datetime] = mapped_column(index=True)
-    json: Mapped[str] = mapped_column()
+    epoch_ms: Mapped[int] = mapped_column(index=True)
+    latitude_e7: Mapped[int | None] = mapped_column()
+    longitude_e7: Mapped[int | None] = mapped_column()
+    accuracy: Mapped[int | None] = mapped_column()
+    altitude: Mapped[int | None] = mapped_column()
+    velocity: Mapped[int | None] = mapped_column()
+    heading: Mapped[int | None] = mapped_column()
+    device_tag: Mapped[int | None] = mapped_column()
+    source: Mapped[str | None] = mapped_column()
+    activity_type: Mapped[str | None] = mapped_column()
+    json: Mapped[str] = mapped_column(compression.CompressedText())
 
     def __str__(self) -> str:
         return f"Record ({self.id}) at {self.timestamp}"
@@ -36,28 +93,96 @@ class Record(Base):
         return f"<{self.id}>@{self.timestamp}"
 
 
-class SemanticLocationHistory(Base):
-    """Mixin for the SemanticLocationHistory files."""
+LOCATION_COLUMNS = (
+    Record.id,
+    Record.timestamp,
+    Record.latitude_e7,
+    Record.longitude_e7,
+    Record.accuracy,
+    Record.altitude,
+    Record.velocity,
+    Record.heading,
+    Record.device_tag,
+    Record.source,
+)
+
+# R*Tree virtual table over the record coordinates, in degrees. It is kept out of
+# the declarative metadata as it has to be created with `CREATE VIRTUAL TABLE`.
+record_rtree = Table(
+    f"{Record.__tablename__}-rtree",
+    MetaData(),
+    Column("id", Integer, primary_key=True),
+    Column("min_latitude", Float),
+    Column("max_latitude", Float),
+    Column("min_longitude", Float),
+    Column("max_longitude", Float),
+)
+
+
+class HeatmapCell(Base):
+    """Table counting the records in each cell of the heatmap tiles."""
+
+    __tablename__ = f"{Record.__tablename__}-heatmap"
+    zoom: Mapped[int] = mapped_column(primary_key=True)
+    x: Mapped[int] = mapped_column(primary_key=True)
+    y: Mapped[int] = mapped_column(primary_key=True)
+    count: Mapped[int] = mapped_column()
+
+
+class DailySummary(Base):
+    """Table summarising the records for each calendar day (in UTC)."""
+
+    __tablename__ = f"{Record.__tablename__}-daily_summary"
+    date: Mapped[datetime.date] = mapped_column(primary_key=True)
+    point_count: Mapped[int] = mapped_column()
+    min_latitude_e7: Mapped[int] = mapped_column()
+    max_latitude_e7: Mapped[int] = mapped_column()
+    min_longitude_e7: Mapped[int] = mapped_column()
+    max_longitude_e7: Mapped[int] = mapped_column()
+    first_timestamp: Mapped[datetime.datetime] = mapped_column()
+    last_timestamp: Mapped[datetime.datetime] = mapped_column()
+    distance_m: Mapped[float] = mapped_column()
+    dominant_activity: Mapped[str | None] = mapped_column()
+
+
+class TimelineObject(Base):
+    """Table for the timeline objects of all the semantic location history files."""
+
+    __tablename__ = "timeline_objects"
+    __table_args__ = (
+        Index(
+            "ix_timeline_objects_interval",
+            "source_month",
+            "start_timestamp",
+            "end_timestamp",
+        ),
+    )
+    id: Mapped[int] = mapped_column(primary_key=True)
+    source_month: Mapped[str] = mapped_column()
+    start_timestamp: Mapped[datetime.datetime] = mapped_column()
+    end_timestamp: Mapped[datetime.datetime] = mapped_column()
+    json: Mapped[str] = mapped_column(compression.CompressedText())
 
-    __abstract__ = True
 
-    id: Mapped[int] = mapped_column(primary_key=True)
-    start_timestamp: Mapped[datetime.datetime] = mapped_column(index=True)
-    end_timestamp: Mapped[datetime.datetime] = mapped_column(index=True)
-    json: Mapped[str] = mapped_column()
+# R*Tree virtual table over the intervals of the timeline objects, as seconds since
+# the epoch. As the R*Tree stores 32-bit floats, the bounds are rounded outwards, so
+# it only gives candidates to be filtered on the exact timestamps.
+timeline_rtree = Table(
+    f"{TimelineObject.__tablename__}-rtree",
+    MetaData(),
+    Column("id", Integer, primary_key=True),
+    Column("min_epoch", Float),
+    Column("max_epoch", Float),
+)
 
 
 @utils.local_cache
-def semantic_location_histories() -> (
-    Mapping[tuple[int, int], type[SemanticLocationHistory]]
-):
-    """Get a mapping of the dates for semantic location history to the models."""
+def semantic_location_histories() -> Mapping[tuple[int, int], str]:
+    """Map the month of each semantic location history to its tracked name."""
     return MappingProxyType(
         {
-            utils.semantic_location_history_to_date(path): type(
-                f"{SemanticLocationHistory.__name__}{''.join(list(str(el) for el in utils.semantic_location_history_to_date(path)))}",
-                (SemanticLocationHistory,),
-                {"__tablename__": utils.table_name(path)},
+            utils.semantic_location_history_to_date(path): utils.table_name(
+                path, version=3
             )
             for path in paths.semantic_location_histories
         }
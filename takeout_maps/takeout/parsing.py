@@ -0,0 +1,130 @@
+"""Parsing the JSON arrays of the takeout files.
+
+Streaming uses the fastest ijson backend that is installed (or the one named by
+`takeout_maps.constants.JSON_BACKEND`). Whole files no larger than
+`takeout_maps.constants.SIMDJSON_MAX_SIZE` are parsed with simdjson when it is
+installed, which also gives the compact JSON of each item without re-encoding it.
+"""
+import functools
+import json
+import typing
+from typing import IO, Iterator
+
+import ijson
+from loguru import logger
+
+import takeout_maps.constants
+from takeout_maps.takeout import sources
+
+try:
+    import simdjson
+except ImportError:
+    simdjson = None  # type: ignore[assignment]
+
+BACKENDS = ("yajl2_c", "yajl2_cffi", "yajl2", "python")
+"""The ijson backends, from the fastest."""
+
+
+@functools.cache
+def backend():
+    """Get the ijson backend to parse with."""
+    names = (
+        (takeout_maps.constants.JSON_BACKEND,)
+        if takeout_maps.constants.JSON_BACKEND
+        else BACKENDS
+    )
+    for name in names:
+        try:
+            return ijson.get_backend(name)
+        except ImportError:
+            logger.debug(f"The {name} ijson backend is not available.")
+    raise ImportError(f"None of the ijson backends {names} are available.")
+
+
+def dumps(o) -> str:
+    """Get the compact JSON of a parsed item."""
+    return json.dumps(o, separators=(",", ":"))
+
+
+def _array_prefix(json_array: str) -> bytes:
+    """Get the JSON that opens the array at `json_array`, e.g. `{"locations": [`."""
+    return (
+        "".join(f"{{{json.dumps(key)}: " for key in json_array.split(".")) + "["
+    ).encode()
+
+
+def iter_batches(
+    fp: IO[bytes],
+    json_array: str,
+    batch_size: int,
+    offset: int = 0,
+    read_size: int = 1 << 16,
+) -> Iterator[tuple[list[dict], int]]:
+    """Parse the items of a JSON array in batches.
+
+    Each batch is yielded with the byte offset just past its last item, so parsing
+    can later be resumed from that offset. Once a batch is full, the following
+    bytes are fed to the parser one at a time until the next item closes, which
+    pins the offset to an exact item boundary.
+    """
+    items = ijson.sendable_list()
+    parser = backend().items_coro(items, json_array + ".item", use_float=True)
+    fp.seek(offset)
+    if offset:
+        parser.send(_array_prefix(json_array))
+        head = fp.read(read_size)
+        offset += len(head) - len(head.lstrip())
+        head = head.lstrip()
+        if not head:
+            return
+        if head.startswith(b","):
+            offset += 1
+            head = head[1:]
+        fp.seek(offset)
+    batch: list[dict] = []
+    position = offset
+    for chunk in iter(functools.partial(fp.read, read_size), b""):
+        start = 0
+        if len(batch) >= batch_size:
+            for start in range(len(chunk)):
+                parser.send(chunk[start : start + 1])
+                if items:
+                    batch.extend(items)
+                    del items[:]
+                    yield batch, position + start + 1
+                    batch = []
+                    break
+            start += 1
+        if start < len(chunk):
+            parser.send(chunk[start:])
+        batch.extend(items)
+        del items[:]
+        position += len(chunk)
+    parser.close()
+    batch.extend(items)
+    if batch:
+        yield batch, position
+
+
+def items(src_file: str, json_array: str) -> Iterator[tuple[dict, str]]:
+    """Parse the items of a JSON array in a file, with the compact JSON of each."""
+    if simdjson is not None and (
+        sources.getsize(src_file) <= takeout_maps.constants.SIMDJSON_MAX_SIZE
+    ):
+        parser = simdjson.Parser()
+        with sources.open(src_file) as fp:
+            array = parser.parse(fp.read())
+        for key in json_array.split("."):
+            if not isinstance(array, simdjson.Object) or key not in array:
+                return
+            array = array[key]
+        if not isinstance(array, simdjson.Array):
+            return
+        for item in array:
+            if isinstance(item, simdjson.Object):
+                # The stubs type `mini` as `str`, but it is the encoded JSON.
+                yield item.as_dict(), typing.cast(bytes, item.mini).decode()
+        return
+    with sources.open(src_file) as fp:
+        for item in backend().items(fp, json_array + ".item", use_float=True):
+            yield item, dumps(item)
@@ -1,11 +1,12 @@
 """Paths to the takeout file."""
-# TODO (Mahdi): Use the zip file rather than the extracted.
 import argparse
+import fnmatch
 import glob
 import os
+import re
 
 import takeout_maps.constants
-from takeout_maps.takeout import utils
+from takeout_maps.takeout import sources, utils
 
 
 @utils.local_cache
@@ -18,46 +19,65 @@ def takeout_path() -> str:
 
 
 @utils.local_cache
-def records_path() -> str:
-    """Get the path to the records."""
-    return os.path.normpath(
-        os.path.join(
-            takeout_path,
-            "Takeout",
-            "Location History",
-            "Records.json",
+def archives() -> tuple[str, ...]:
+    """Get the zip archives of the takeout, if it has not been extracted.
+
+    The takeout may be a zip, one part of a multi-part export (in which case all
+    the parts are used), or a directory of `takeout-*.zip` parts.
+    """
+    if takeout_path is None:
+        return ()
+    if os.path.isfile(takeout_path):
+        return tuple(
+            sorted(
+                glob.glob(re.sub(r"-\d+\.zip$", "-*.zip", glob.escape(takeout_path)))
+            )
+            or (takeout_path,)
         )
+    if os.path.isdir(os.path.join(takeout_path, "Takeout")):
+        return ()
+    return tuple(
+        sorted(glob.glob(os.path.join(glob.escape(takeout_path), "takeout-*.zip")))
     )
 
 
+def _path(*parts: str) -> str:
+    """Get the path to a file in the takeout, in whichever archive contains it."""
+    member = "/".join(parts)
+    for archive in archives:
+        if member in sources.members(archive):
+            return sources.join(archive, member)
+    return os.path.normpath(os.path.join(takeout_path, *parts))
+
+
+@utils.local_cache
+def records_path() -> str:
+    """Get the path to the records."""
+    return _path("Takeout", "Location History", "Records.json")
+
+
 @utils.local_cache
 def semantic_location_histories() -> tuple[str, ...]:
     """Get a list of all the semantic location histories."""
+    parts = ("Takeout", "Location History", "Semantic Location History", "*", "*.json")
+    pattern = "/".join(parts)
     return tuple(
-        glob.glob(
-            os.path.normpath(
-                os.path.join(
-                    takeout_path,
-                    "Takeout",
-                    "Location History",
-                    "Semantic Location History",
-                    "*",
-                    "*.json",
-                )
-            )
-        )
+        glob.glob(os.path.normpath(os.path.join(glob.escape(takeout_path), *parts)))
+    ) + tuple(
+        sources.join(archive, member)
+        for archive in archives
+        for member in sources.members(archive)
+        if fnmatch.fnmatchcase(member, pattern)
+        and member.count("/") == pattern.count("/")
     )
 
 
 def semantic_location_history(year: int, month: int):
     """Get the path to a semantic location history from the date."""
-    return os.path.normpath(
-        os.path.join(
-            takeout_path,
-            "Takeout",
-            "Location History",
-            "Semantic Location History",
-            f"{year}",
-            f"{year}_{takeout_maps.constants.MONTHS[month-1]}.json",
-        )
+    return _path(
+        "Takeout",
+        "Location History",
+        "Semantic Location History",
+        f"{year}",
+        f"{year}_{takeout_maps.constants.MONTHS[month-1]}.json",
     )
@@ -0,0 +1,78 @@
+"""Line simplification of the location arrays for display at a zoom level."""
+import numpy as np
+
+from takeout_maps.takeout import arrays
+
+TILE_SIZE = 256
+
+
+def project(latitude_e7: np.ndarray, longitude_e7: np.ndarray) -> np.ndarray:
+    """Project E7 coordinates to web mercator pixels at zoom level 0."""
+    longitude = np.radians(longitude_e7 / 1e7)
+    latitude = np.radians(np.clip(latitude_e7 / 1e7, -85.0511, 85.0511))
+    return np.column_stack(
+        (
+            (longitude + np.pi) / (2 * np.pi) * TILE_SIZE,
+            (np.pi - np.log(np.tan(np.pi / 4 + latitude / 2)))
+            / (2 * np.pi)
+            * TILE_SIZE,
+        )
+    )
+
+
+def tolerance(zoom: float, pixels: float = 1.0) -> float:
+    """Get the tolerance, in zoom level 0 pixels, of `pixels` at a zoom level."""
+    return pixels / 2**zoom
+
+
+def douglas_peucker(points: np.ndarray, epsilon: float) -> np.ndarray:
+    """Get a mask of the points kept by Douglas-Peucker simplification.
+
+    The distances from every point in a span to its chord are computed in a single
+    vectorised pass, and spans are processed from a stack rather than recursively.
+    """
+    keep = np.zeros(len(points), dtype=bool)
+    if len(points) < 3:
+        keep[:] = True
+        return keep
+    keep[[0, -1]] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        start, end = points[first], points[last]
+        interior = points[first + 1 : last]
+        chord = end - start
+        length = np.hypot(*chord)
+        if length == 0:
+            distances = np.hypot(*(interior - start).T)
+        else:
+            distances = (
+                np.abs(
+                    chord[0] * (start[1] - interior[:, 1])
+                    - chord[1] * (start[0] - interior[:, 0])
+                )
+                / length
+            )
+        furthest = int(np.argmax(distances))
+        if distances[furthest] > epsilon:
+            index = first + 1 + furthest
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+    return keep
+
+
+def simplify(
+    locations: arrays.LocationArrays, zoom: float, pixels: float = 1.0
+) -> arrays.LocationArrays:
+    """Simplify the path of the locations for display at a zoom level."""
+    if len(locations) < 3:
+        return locations
+    return locations.take(
+        douglas_peucker(
+            project(locations.latitude_e7, locations.longitude_e7),
+            tolerance(zoom, pixels),
+        )
+    )
@@ -0,0 +1,155 @@
+"""Reading the takeout files, whether extracted or still inside the zip archives.
+
+A file inside an archive is addressed by the path of the archive joined with the
+name of the member, e.g. `takeout-001.zip/Takeout/Location History/Records.json`.
+"""
+import builtins
+import functools
+import hashlib
+import io
+import mmap
+import os
+import re
+import struct
+import zipfile
+from typing import IO, cast
+
+_LOCAL_HEADER_SIZE = 30
+"""The size of the fixed part of the local header of a member."""
+_LOCAL_HEADER_LENGTHS = struct.Struct("<HH")
+"""The lengths of the name and extra field, at byte 26 of the local header."""
+
+
+def join(archive: str, member: str) -> str:
+    """Get the path to a member of an archive."""
+    return f"{archive}/{member}"
+
+
+def split(path: str) -> tuple[str, str] | None:
+    """Split the path to a member of an archive into the archive and the member.
+
+    Paths to files that are not inside an archive give `None`.
+    """
+    for match in re.finditer(r"\.zip[/\\]", path, flags=re.IGNORECASE):
+        archive = path[: match.start() + len(".zip")]
+        if os.path.isfile(archive):
+            return archive, path[match.end() :].replace("\\", "/")
+    return None
+
+
+@functools.lru_cache(maxsize=None)
+def members(archive: str) -> dict[str, zipfile.ZipInfo]:
+    """Get the members of an archive by name."""
+    with zipfile.ZipFile(archive) as zf:
+        return {info.filename: info for info in zf.infolist()}
+
+
+class _MappedMember(io.RawIOBase):
+    """Read-only file over a stored member of a memory-mapped archive.
+
+    The member is uncompressed, so reading it neither decompresses nor copies the
+    archive.
+    """
+
+    def __init__(self, mapped: mmap.mmap, start: int, size: int) -> None:
+        self._mapped = mapped
+        self._view = memoryview(mapped)[start : start + size]
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {
+            io.SEEK_SET: 0,
+            io.SEEK_CUR: self._position,
+            io.SEEK_END: len(self._view),
+        }
+        self._position = max(0, base[whence] + offset)
+        return self._position
+
+    def readinto(self, buffer) -> int:
+        data = self._view[self._position : self._position + len(buffer)]
+        buffer[: len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+    def close(self) -> None:
+        if not self.closed:
+            self._view.release()
+            self._mapped.close()
+        super().close()
+
+
+def open(path: str) -> IO[bytes]:
+    """Open a takeout file for reading in binary.
+
+    Stored members of an archive are memory-mapped and deflated members are
+    decompressed as they are read, so neither is extracted to disk.
+    """
+    location = split(path)
+    if location is None:
+        return builtins.open(path, "rb")
+    archive, member = location
+    info = members(archive)[member]
+    if info.compress_type == zipfile.ZIP_STORED and not info.flag_bits & 0x1:
+        with builtins.open(archive, "rb") as fp:
+            mapped = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        name_length, extra_length = _LOCAL_HEADER_LENGTHS.unpack_from(
+            mapped, info.header_offset + 26
+        )
+        return cast(
+            IO[bytes],
+            _MappedMember(
+                mapped,
+                info.header_offset + _LOCAL_HEADER_SIZE + name_length + extra_length,
+                info.file_size,
+            ),
+        )
+    # The member keeps the archive open after the `ZipFile` is closed.
+    with zipfile.ZipFile(archive) as zf:
+        return zf.open(info)
+
+
+def getsize(path: str) -> int:
+    """Get the (uncompressed) size of a takeout file."""
+    location = split(path)
+    if location is None:
+        return os.path.getsize(path)
+    archive, member = location
+    return members(archive)[member].file_size
+
+
+@functools.lru_cache(maxsize=None)
+def fingerprint(path: str, samples: int = 16, sample_size: int = 1 << 16) -> str:
+    """Get a hash of the content of a takeout file.
+
+    Files larger than `samples` chunks of `sample_size` bytes are hashed from
+    evenly spaced samples, including the start and the end, along with their size,
+    so a large file is fingerprinted without reading all of it. Members of an
+    archive are fingerprinted from the CRC, size and modification time recorded in
+    the archive instead, so they are not decompressed.
+    """
+    location = split(path)
+    if location is not None:
+        archive, member = location
+        info = members(archive)[member]
+        return hashlib.sha256(
+            repr((member, info.CRC, info.file_size, info.date_time)).encode()
+        ).hexdigest()
+    size = getsize(path)
+    digest = hashlib.sha256(str(size).encode())
+    with open(path) as fp:
+        if size <= samples * sample_size:
+            digest.update(fp.read())
+        else:
+            for sample in range(samples):
+                fp.seek((size - sample_size) * sample // (samples - 1))
+                digest.update(fp.read(sample_size))
+    return digest.hexdigest()
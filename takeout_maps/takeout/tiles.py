@@ -0,0 +1,86 @@
+"""Heatmap tiles aggregated from the records on a web mercator grid."""
+from typing import Any, Iterator
+
+import numpy as np
+
+from takeout_maps.takeout import arrays, simplify
+
+GRID = 64
+"""The number of cells along each side of a tile."""
+MAX_ZOOM = 12
+"""The highest zoom level that is pre-aggregated in the index."""
+
+
+def cells(
+    latitude_e7: np.ndarray, longitude_e7: np.ndarray, zoom: int
+) -> tuple[np.ndarray, np.ndarray]:
+    """Get the global x and y of the cells containing the coordinates."""
+    size = 2**zoom * GRID
+    pixels = np.floor(
+        simplify.project(latitude_e7, longitude_e7) * (size / simplify.TILE_SIZE)
+    )
+    pixels = np.clip(pixels, 0, size - 1).astype(np.int64)
+    return pixels[:, 0], pixels[:, 1]
+
+
+def count_cells(
+    x: np.ndarray, y: np.ndarray
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Count the coordinates in each distinct cell."""
+    keys, counts = np.unique((x << 32) | y, return_counts=True)
+    return keys >> 32, keys & 0xFFFFFFFF, counts
+
+
+def aggregate(
+    latitude_e7: np.ndarray, longitude_e7: np.ndarray
+) -> Iterator[dict[str, int]]:
+    """Count the coordinates in the cells of every pre-aggregated zoom level.
+
+    The cells at the highest zoom level are computed once, and each lower level is
+    found by halving the cell coordinates of the level above.
+    """
+    x, y = cells(latitude_e7, longitude_e7, MAX_ZOOM)
+    for zoom in range(MAX_ZOOM, -1, -1):
+        for cell_x, cell_y, count in zip(*(a.tolist() for a in count_cells(x, y))):
+            yield dict(zoom=zoom, x=cell_x, y=cell_y, count=count)
+        x, y = x >> 1, y >> 1
+
+
+def unproject(x: np.ndarray, y: np.ndarray, zoom: int) -> tuple[np.ndarray, np.ndarray]:
+    """Get the latitude and longitude, in degrees, of global cell coordinates."""
+    size = 2**zoom * GRID
+    longitude = x / size * 360 - 180
+    latitude = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * y / size))))
+    return latitude, longitude
+
+
+def bounds(zoom: int, x: int, y: int) -> arrays.BoundingBox:
+    """Get the bounding box of a tile."""
+    (north, south), (west, east) = unproject(
+        np.array([x, x + 1]) * GRID, np.array([y, y + 1]) * GRID, zoom
+    )
+    return arrays.BoundingBox(
+        west=float(west), south=float(south), east=float(east), north=float(north)
+    )
+
+
+def feature_collection(
+    zoom: int, x: np.ndarray, y: np.ndarray, counts: np.ndarray
+) -> dict[str, Any]:
+    """Create a GeoJSON feature collection of the cell centres and their counts."""
+    latitude, longitude = unproject(x + 0.5, y + 0.5, zoom)
+    return {
+        "type": "FeatureCollection",
+        "features": [
+            {
+                "type": "Feature",
+                "geometry": {"type": "Point", "coordinates": [lng, lat]},
+                "properties": {"count": count},
+            }
+            for lat, lng, count in zip(
+                np.round(latitude, 6).tolist(),
+                np.round(longitude, 6).tolist(),
+                counts.tolist(),
+            )
+        ],
+    }
@@ -1,19 +1,42 @@
 """Utility functions for indexing."""
+import asyncio
+import concurrent.futures
 import datetime
-import hashlib
+import functools
 import os
-from typing import Callable, TypeVar
+from typing import Awaitable, Callable, ParamSpec, TypeVar
 
 from takeout_maps import constants
 
+P = ParamSpec("P")
 T = TypeVar("T")
 
+query_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=constants.QUERY_WORKERS, thread_name_prefix="takeout-query"
+)
+
 
 def local_cache(fn: Callable[[], T]) -> T:
     """Store the value as the function."""
     return fn()
 
 
+def run_in_executor(fn: Callable[P, T]) -> Callable[P, Awaitable[T]]:
+    """Create an async variant of a blocking function.
+
+    Calls run on the bounded `query_executor`, so the event loop is never blocked
+    and at most `constants.QUERY_WORKERS` queries run at once.
+    """
+
+    @functools.wraps(fn)
+    async def wrapper(*args: P.args, **kwargs: P.kwargs) -> T:
+        return await asyncio.get_running_loop().run_in_executor(
+            query_executor, functools.partial(fn, *args, **kwargs)
+        )
+
+    return wrapper
+
+
 def stat_to_dict(result: os.stat_result | str):
     """Convert a stat_result to a dictionary."""
     if isinstance(result, str):
@@ -21,11 +44,34 @@ def stat_to_dict(result: os.stat_result | str):
     return {k: getattr(result, k) for k in sorted(dir(result)) if k.startswith("st_")}
 
 
-def table_name(path: str):
-    """Get the table name for a json file."""
-    from takeout_maps.takeout import paths
+def table_name(path: str, version: int | None = None):
+    """Get the table name for a json file.
 
-    return f"{os.path.basename(paths.takeout_path)}-{os.path.splitext(os.path.basename(path))[0]}-{hashlib.sha256(str(stat_to_dict(os.stat(path))).encode()).hexdigest()}"
+    Names only depend on the name of the file, so that a new export updates the
+    tables built from the previous one (see `sources.fingerprint`). The `version`
+    should be bumped whenever the schema of the table changes, so that the file is
+    re-indexed into a new table.
+    """
+    name = f"takeout-{os.path.splitext(os.path.basename(path))[0]}"
+    if version is not None:
+        name += f"-v{version}"
+    return name
+
+
+def epoch_ms(value: datetime.date | datetime.datetime) -> int:
+    """Get the milliseconds since the epoch, treating naive values as UTC."""
+    if not isinstance(value, datetime.datetime):
+        value = datetime.datetime.combine(value, datetime.time())
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    return round(value.timestamp() * 1000)
+
+
+def utc(value: datetime.datetime) -> datetime.datetime:
+    """Convert a timestamp to naive UTC, treating naive values as UTC."""
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
 
 
 def semantic_location_history_to_date(path: str):
@@ -34,6 +80,11 @@ def semantic_location_history_to_date(path: str):
     return int(year), constants.MONTH_TO_INT[month]
 
 
+def month_key(year: int, month: int) -> str:
+    """Get the key for a month, as stored in the timeline objects table."""
+    return f"{year:04d}-{month:02d}"
+
+
 def months(
     start: datetime.datetime,
     end: datetime.datetime | datetime.timedelta,
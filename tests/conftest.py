@@ -0,0 +1,6 @@
+"""Configure the takeout before the package reads it at import."""
+import os
+import sys
+
+sys.argv = sys.argv[:1]
+os.environ.setdefault("GOOGLE_TAKEOUT_DIRECTORY", os.path.dirname(__file__))
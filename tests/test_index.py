@@ -0,0 +1,47 @@
+"""Tests of the background indexing."""
+import threading
+
+import pytest
+
+from takeout_maps import exceptions
+from takeout_maps.takeout import index
+
+
+@pytest.fixture(autouse=True)
+def _collect_garbage(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(index, "collect_garbage", lambda: None)
+
+
+def ensure_reports_a_failed_build_test():
+    def build():
+        raise ValueError("corrupt takeout")
+
+    indexer = index.Indexer()
+    indexer.register("broken", build, lambda: [])
+    indexer.start()
+    assert indexer._thread is not None
+    indexer._thread.join()
+    with pytest.raises(exceptions.IndexFailedError) as error:
+        indexer.ensure("broken")
+    assert error.value.status_code == 500
+    assert "corrupt takeout" in error.value.detail
+    assert indexer.status()["broken"]["error"] == repr(ValueError("corrupt takeout"))
+
+
+def ensure_does_not_block_on_a_running_build_test():
+    started, release = threading.Event(), threading.Event()
+
+    def build():
+        started.set()
+        release.wait()
+
+    indexer = index.Indexer()
+    indexer.register("slow", build, lambda: [])
+    indexer.start()
+    started.wait()
+    with pytest.raises(exceptions.IndexNotReadyError):
+        indexer.ensure("slow")
+    release.set()
+    assert indexer._thread is not None
+    indexer._thread.join()
+    indexer.ensure("slow")
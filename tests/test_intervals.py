@@ -0,0 +1,40 @@
+"""Tests of the interval tree."""
+import random
+
+import pytest
+
+from takeout_maps.takeout import intervals
+
+
+def _random_intervals(rng: random.Random, count: int) -> list[tuple[int, int, int]]:
+    """Draw intervals over a few endpoints, so many of them share endpoints."""
+    return [
+        (start, start + rng.choice([0, 0, 1, 2, 5, 12]), value)
+        for value, start in enumerate(rng.randrange(20) for _ in range(count))
+    ]
+
+
+@pytest.mark.parametrize("seed", range(20))
+def at_matches_a_scan_test(seed: int):
+    rng = random.Random(seed)
+    items = _random_intervals(rng, rng.randrange(60))
+    tree = intervals.IntervalTree(items)
+    assert len(tree) == len(items)
+    for point in range(-2, 35):
+        expected = [value for start, end, value in items if start <= point <= end]
+        assert sorted(tree.at(point)) == expected
+
+
+@pytest.mark.parametrize("seed", range(20))
+def overlapping_matches_a_scan_test(seed: int):
+    rng = random.Random(seed)
+    items = _random_intervals(rng, rng.randrange(60))
+    tree = intervals.IntervalTree(items)
+    for start in range(-2, 35):
+        for end in range(start, 36):
+            expected = [
+                value
+                for interval_start, interval_end, value in items
+                if interval_start < end and interval_end >= start
+            ]
+            assert sorted(tree.overlapping(start, end)) == expected
@@ -0,0 +1,29 @@
+"""Tests of the parsing of the takeout JSON."""
+import io
+import json
+
+import pytest
+
+from takeout_maps.takeout import parsing
+
+ITEMS = [
+    {"timestamp": f"2020-01-01T00:00:{i:02}Z", "latitudeE7": i, "tags": [i] * (i % 3)}
+    for i in range(23)
+]
+
+
+@pytest.mark.parametrize("indent", [None, 2])
+@pytest.mark.parametrize("batch_size", [1, 4, 30])
+@pytest.mark.parametrize("read_size", [1, 7, 1 << 16])
+def iter_batches_resumes_from_every_offset_test(
+    indent: int | None, batch_size: int, read_size: int
+):
+    data = json.dumps({"locations": ITEMS, "deviceSettings": []}, indent=indent)
+    fp = io.BytesIO(data.encode())
+    batches = list(parsing.iter_batches(fp, "locations", batch_size, 0, read_size))
+    assert [item for batch, _ in batches for item in batch] == ITEMS
+    done = 0
+    for batch, offset in batches:
+        done += len(batch)
+        resumed = parsing.iter_batches(fp, "locations", batch_size, offset, read_size)
+        assert [item for batch, _ in resumed for item in batch] == ITEMS[done:]
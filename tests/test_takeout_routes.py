@@ -0,0 +1,40 @@
+"""Tests of the takeout routes."""
+import datetime
+
+import pytest
+
+from takeout_maps.api.takeout import semantic_location_history
+from takeout_maps.routes import takeout as takeout_routes
+
+START = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+END = datetime.datetime(2020, 1, 2, tzinfo=datetime.timezone.utc)
+
+
+@pytest.fixture(autouse=True)
+def _all_range(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(takeout_routes, "all_range", lambda: (START, END))
+
+
+def activities_skip_segments_without_duration_test():
+    history = semantic_location_history.SemanticLocationHistory.model_validate(
+        {
+            "timelineObjects": [
+                {
+                    "id": 1,
+                    "activitySegment": {
+                        "duration": {
+                            "startTimestamp": "2020-01-01T08:00:00Z",
+                            "endTimestamp": "2020-01-01T09:00:00Z",
+                        },
+                        "activityType": "WALKING",
+                    },
+                },
+                {"id": 2, "activitySegment": {"activityType": "CYCLING"}},
+                {"id": 3},
+            ]
+        }
+    )
+    dataset = takeout_routes._activities(history)
+    assert [activity.id for activity in dataset.data] == [1]
+    assert dataset.data[0].type == "WALKING"
+    assert dataset.data[0].end - dataset.data[0].start == datetime.timedelta(hours=1)
@@ -0,0 +1,37 @@
+"""Tests of the wire formats."""
+import json
+
+import numpy as np
+import pytest
+
+from takeout_maps.api import wire
+
+GOOGLE_PATH = "_p~iF~ps|U_ulLnnqC_mqNvxq`@"
+"""The polyline of Google's reference path, from the format's documentation."""
+
+
+@pytest.mark.parametrize(
+    "values, expected",
+    [
+        ([[0]], "?"),
+        ([[-17998321]], "`~oia@"),
+        (
+            [[3850000, -12020000], [4070000, -12095000], [4325200, -12645300]],
+            GOOGLE_PATH,
+        ),
+    ],
+)
+def polyline_encodes_known_answers_test(values: list[list[int]], expected: str):
+    assert wire._polyline(np.array(values, dtype=np.int64)) == expected
+
+
+def polyline_rounds_e7_to_e5_test():
+    latitude_e7 = np.array([385000049, 406999951, 432520000])
+    longitude_e7 = np.array([-1202000049, -1209499951, -1264530000])
+    epoch_ms = np.array([1_600_000_000_000, 1_600_000_000_999, 1_600_000_005_000])
+    body = json.loads(wire.polyline(latitude_e7, longitude_e7, epoch_ms, date="x"))
+    assert body["path"] == GOOGLE_PATH
+    assert body["timestamps"] == wire._polyline(
+        np.array([[1_600_000_000], [1_600_000_000], [1_600_000_005]])
+    )
+    assert body["date"] == "x"
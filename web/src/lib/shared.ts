@@ -153,7 +153,7 @@ export type Type2 =
 	| null;
 export type Id2 = number | null;
 export type Errormessage = string;
-export type Errorid = 'date-out-of-range';
+export type Errorid = 'date-out-of-range' | 'not-acceptable';
 export type Start3 = string;
 export type End3 = string;
 export type Value = number;